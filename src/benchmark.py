@@ -0,0 +1,636 @@
+# benchmark.py
+"""Throughput benchmark for the schematic splitter pipeline.
+
+Times each stage separately (load, entity processing, process_chunk_data,
+varintWriter.write, saving at each gzip level and uncompressed, and
+resplit_oversized) over the tests/*.schem fixtures and/or generated
+schematics, and reports blocks per second, output sizes and memory as
+JSON so results can be compared between versions. Each file is run in a
+fresh process, so its peak RSS is its own; --trace-memory also records
+the peak Python/NumPy allocation of every stage.
+
+    python benchmark.py                         # all tests/*.schem fixtures
+    python benchmark.py --synthetic 1000x256x1000 --palette-size 400
+
+With --calibrate-size-model it instead refits the coefficients of
+sizeModel against every chunk of the given schematics at several block
+limits and reports them with the fit's relative errors.
+"""
+
+import argparse
+import contextlib
+import glob
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+from typing import Dict, List, Sequence, Tuple
+
+import amulet_nbt
+import numpy as np
+from amulet_nbt import (
+    ByteArrayTag,
+    CompoundTag,
+    DoubleTag,
+    IntArrayTag,
+    IntTag,
+    ListTag,
+    ShortTag,
+    StringTag,
+)
+
+import schematicutil
+import sizeModel
+import varintWriter
+from parallelGzip import DEFAULT_LEVEL, CompressionPolicy
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(SRC_DIR, os.pardir, "tests")
+
+
+def load_splitter():
+    """Import schematic-splitter.py, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location(
+        "schematic_splitter", os.path.join(SRC_DIR, "schematic-splitter.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+splitter = load_splitter()
+
+
+def peak_rss() -> int:
+    """Return the process's peak resident set size in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def parse_dims(value: str) -> Tuple[int, int, int]:
+    """Parse a WIDTHxHEIGHTxLENGTH string."""
+    parts = value.lower().split("x")
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError("dimensions must look like 256x128x256")
+    return int(parts[0]), int(parts[1]), int(parts[2])
+
+
+# ---------------------------------------------------------------------------
+# Synthetic schematics
+# ---------------------------------------------------------------------------
+
+
+def make_synthetic_schematic(
+    path: str,
+    dims: Tuple[int, int, int],
+    palette_size: int = 64,
+    entity_density: float = 0.0,
+    seed: int = 0,
+) -> str:
+    """Write a generated Sponge v3 schematic to path.
+
+    Blocks are laid out in runs along X with an air-heavy upper half, so
+    compression behaves more like a real build than uniform noise would.
+
+    Args:
+        dims: (width, height, length) of the volume.
+        palette_size: Number of block palette entries (including air).
+        entity_density: Entities and block entities per 1000 blocks.
+        seed: Random seed, so the same arguments give the same file.
+    """
+    width, height, length = dims
+    rng = np.random.default_rng(seed)
+    dtype = np.uint8 if palette_size <= 256 else np.uint32
+
+    # Generated and encoded one layer at a time, so the decoded volume is
+    # never held whole; the encoded data and entities still are
+    layer_size = width * length
+    encoded = bytearray()
+    for y in range(height):
+        run_ids = rng.integers(1, max(2, palette_size), size=ceil(layer_size / 8))
+        layer = np.repeat(run_ids.astype(dtype), 8)[:layer_size]
+        if y > height // 2:
+            layer[rng.random(layer_size) < 0.8] = 0
+        encoded += varintWriter.encode(layer)
+
+    palette = {"minecraft:air": IntTag(0)}
+    for i in range(1, palette_size):
+        palette[f"minecraft:bench_block_{i}"] = IntTag(i)
+
+    total = width * height * length
+    count = int(total * entity_density / 1000)
+    xs = rng.integers(0, width, size=count)
+    ys = rng.integers(0, height, size=count)
+    zs = rng.integers(0, length, size=count)
+    entities = ListTag(
+        [
+            CompoundTag(
+                {
+                    "Id": StringTag("minecraft:armor_stand"),
+                    "Pos": ListTag(
+                        [DoubleTag(x + 0.5), DoubleTag(y), DoubleTag(z + 0.5)]
+                    ),
+                    "Data": CompoundTag({"id": StringTag("minecraft:armor_stand")}),
+                }
+            )
+            for x, y, z in zip(xs.tolist(), ys.tolist(), zs.tolist())
+        ]
+    )
+    block_entities = ListTag(
+        [
+            CompoundTag(
+                {
+                    "Id": StringTag("minecraft:chest"),
+                    "Pos": IntArrayTag([x, y, z]),
+                    "Data": CompoundTag({"id": StringTag("minecraft:chest")}),
+                }
+            )
+            for x, y, z in zip(xs.tolist(), ys.tolist(), zs.tolist())
+        ]
+    )
+
+    schematic = CompoundTag(
+        {
+            "Version": IntTag(3),
+            "DataVersion": IntTag(3700),
+            "Width": ShortTag(width),
+            "Height": ShortTag(height),
+            "Length": ShortTag(length),
+            "Offset": IntArrayTag([0, 0, 0]),
+            "Blocks": CompoundTag(
+                {
+                    "Palette": CompoundTag(palette),
+                    "Data": ByteArrayTag(np.frombuffer(encoded, dtype=np.int8)),
+                    "BlockEntities": block_entities,
+                }
+            ),
+            "Entities": entities,
+        }
+    )
+    amulet_nbt.NamedTag(CompoundTag({"Schematic": schematic})).save_to(
+        path, compressed=True
+    )
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+
+class StageTimer:
+    """Collect wall time, throughput and memory for named stages.
+
+    peak_rss_bytes is the process's high-water mark after the stage, and
+    rss_rise_bytes how far the stage raised it, so a stage that stays under
+    an earlier peak shows no rise. While tracemalloc is tracing,
+    traced_peak_bytes is the most the stage allocated above what was held
+    when it started.
+    """
+
+    def __init__(self, blocks: int):
+        self.blocks = blocks
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def run(self, name: str, func, *args, **kwargs):
+        rss_before = peak_rss()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        rss_after = peak_rss()
+        self.stages[name] = {
+            "seconds": round(seconds, 6),
+            "blocks_per_second": round(self.blocks / seconds) if seconds else None,
+            "peak_rss_bytes": rss_after,
+            "rss_rise_bytes": rss_after - rss_before,
+        }
+        if tracing:
+            traced_peak = tracemalloc.get_traced_memory()[1] - traced_before
+            self.stages[name]["traced_peak_bytes"] = traced_peak
+        return result
+
+
+def _encode_all(chunk_data: Tuple[Dict, ...]) -> int:
+    chunk, _, _, chunk_dimensions, chunk_biomes, _ = chunk_data
+    written = 0
+    for file_num, indices in chunk.items():
+        w, h, l = chunk_dimensions[file_num]
+        written += len(varintWriter.write(indices, w, h, l))
+        if chunk_biomes is not None:
+            written += len(varintWriter.write(chunk_biomes[file_num], w, h, l))
+    return written
+
+
+def _save_all(
+    tags: List[amulet_nbt.NamedTag],
+    output_directory: str,
+    compression: CompressionPolicy,
+) -> List[str]:
+    os.makedirs(output_directory, exist_ok=True)
+    written = []
+    for i, tag in enumerate(tags):
+        path = os.path.join(output_directory, f"Bench{i}.schem")
+        with open(path, "wb") as f:
+            f.write(splitter.encode_tag(tag, compression))
+        written.append(path)
+    return written
+
+
+def benchmark_file(
+    filename: str,
+    block_limit: int,
+    scratch_directory: str,
+    compression_levels: Sequence[int] = (1, 6, DEFAULT_LEVEL),
+) -> Dict[str, object]:
+    """Run every pipeline stage on one schematic and return its results.
+
+    The chunks are saved once per level in compression_levels (stages
+    "gzip_save_<level>") and once as raw NBT ("raw_save"), with the output
+    size of each in "output_bytes_by_level". Files saved at the default
+    level are then re-split.
+    """
+    source_file = schematicutil.load_schematic(filename)
+    source_dims = schematicutil.get_dimension(source_file)
+    total_blocks = source_dims[0] * source_dims[1] * source_dims[2]
+    timer = StageTimer(total_blocks)
+
+    # Time a fresh load; the first one above also warms the page cache
+    source_file = timer.run("load", schematicutil.load_schematic, filename)
+    source_offset = schematicutil.get_offset(source_file)
+    max_chunk_dims = splitter.calculate_chunk_dimensions(*source_dims, block_limit)
+    chunk_width = ceil(source_dims[0] / max_chunk_dims[0])
+    chunk_length = ceil(source_dims[2] / max_chunk_dims[2])
+    source_blocks = schematicutil.get_block_data(source_file)
+
+    def process_all_entities():
+        entities = splitter.process_entities(
+            schematicutil.get_entities(source_file),
+            max_chunk_dims,
+            chunk_width,
+            chunk_length,
+        )
+        block_entities = splitter.process_block_entities(
+            source_blocks["BlockEntities"], max_chunk_dims, chunk_width, chunk_length
+        )
+        return entities, block_entities
+
+    chunk_entities, chunk_block_entities = timer.run("entities", process_all_entities)
+
+    chunk_data = timer.run(
+        "process_chunk_data",
+        splitter.process_chunk_data,
+        source_blocks,
+        schematicutil.get_biome_data(source_file),
+        max_chunk_dims,
+        source_dims,
+        source_offset,
+        chunk_width,
+        chunk_length,
+    )
+    encoded_bytes = timer.run("varint_write", _encode_all, chunk_data)
+
+    chunk, chunk_palette, chunk_offset, chunk_dimensions, biomes, biome_palette = (
+        chunk_data
+    )
+    tags = [
+        splitter.build_chunk_tag(
+            source_file,
+            chunk_dimensions[file_num],
+            chunk_offset[file_num],
+            chunk[file_num],
+            chunk_palette[file_num],
+            biomes[file_num] if biomes is not None else None,
+            biome_palette[file_num] if biomes is not None else None,
+            chunk_block_entities.get(file_num),
+            chunk_entities.get(file_num),
+        )
+        for file_num in chunk
+    ]
+    output_bytes_by_level: Dict[str, int] = {}
+    for level in compression_levels:
+        level_directory = os.path.join(scratch_directory, f"level{level}")
+        level_files = timer.run(
+            f"gzip_save_{level}",
+            _save_all,
+            tags,
+            level_directory,
+            CompressionPolicy(level),
+        )
+        output_bytes_by_level[str(level)] = sum(map(os.path.getsize, level_files))
+        shutil.rmtree(level_directory, ignore_errors=True)
+    raw_directory = os.path.join(scratch_directory, "raw")
+    raw_files = timer.run(
+        "raw_save", _save_all, tags, raw_directory, CompressionPolicy(compressed=False)
+    )
+    output_bytes_by_level["raw"] = sum(map(os.path.getsize, raw_files))
+    shutil.rmtree(raw_directory, ignore_errors=True)
+
+    save_directory = os.path.join(scratch_directory, "save")
+    written = _save_all(tags, save_directory, CompressionPolicy())
+    output_bytes = sum(os.path.getsize(path) for path in written)
+
+    # Force a resplit of the larger half of the outputs
+    sizes = sorted(os.path.getsize(path) for path in written)
+    timer.run(
+        "resplit_oversized",
+        splitter.resplit_oversized,
+        written,
+        max(1, sizes[len(sizes) // 2]),
+        save_directory,
+        "Bench",
+        block_limit,
+    )
+
+    return {
+        "file": os.path.basename(filename),
+        "dimensions": list(source_dims),
+        "blocks": total_blocks,
+        "block_limit": block_limit,
+        "chunks": len(chunk),
+        "encoded_bytes": encoded_bytes,
+        "output_bytes": output_bytes,
+        "output_bytes_by_level": output_bytes_by_level,
+        "stages": timer.stages,
+    }
+
+
+def _benchmark_isolated(
+    filename: str,
+    block_limit: int,
+    scratch_directory: str,
+    compression_levels: Sequence[int],
+    trace_memory: bool,
+) -> Dict[str, object]:
+    """Worker entry point: benchmark_file in a process of its own."""
+    if trace_memory:
+        tracemalloc.start()
+    # Keep the splitter's progress output off stdout and the report
+    with contextlib.redirect_stdout(sys.stderr):
+        return benchmark_file(
+            filename, block_limit, scratch_directory, compression_levels
+        )
+
+
+# ---------------------------------------------------------------------------
+# Size model calibration
+# ---------------------------------------------------------------------------
+
+
+def size_samples(
+    filename: str, block_limit: int
+) -> Tuple[List[List[float]], List[int], List[int]]:
+    """Collect sizeModel features and real compressed sizes for each chunk.
+
+    Returns:
+        (features, compressed sizes, base sizes), one entry per chunk.
+    """
+    source_file = schematicutil.load_schematic(filename)
+    source_dims = schematicutil.get_dimension(source_file)
+    max_chunk_dims = splitter.calculate_chunk_dimensions(*source_dims, block_limit)
+    chunk_width = ceil(source_dims[0] / max_chunk_dims[0])
+    chunk_length = ceil(source_dims[2] / max_chunk_dims[2])
+    source_blocks = schematicutil.get_block_data(source_file)
+
+    chunk_entities = splitter.process_entities(
+        schematicutil.get_entities(source_file),
+        max_chunk_dims,
+        chunk_width,
+        chunk_length,
+    )
+    chunk_block_entities = splitter.process_block_entities(
+        source_blocks["BlockEntities"], max_chunk_dims, chunk_width, chunk_length
+    )
+    chunk, chunk_palette, chunk_offset, chunk_dimensions, biomes, biome_palette = (
+        splitter.process_chunk_data(
+            source_blocks,
+            schematicutil.get_biome_data(source_file),
+            max_chunk_dims,
+            source_dims,
+            schematicutil.get_offset(source_file),
+            chunk_width,
+            chunk_length,
+        )
+    )
+    base_size = splitter.chunk_base_size(source_file)
+
+    features, sizes = [], []
+    for file_num in chunk:
+        chunk_args = (
+            chunk[file_num],
+            chunk_palette[file_num],
+            biomes[file_num] if biomes is not None else None,
+            biome_palette[file_num] if biomes is not None else None,
+            chunk_block_entities.get(file_num),
+            chunk_entities.get(file_num),
+        )
+        tag = splitter.build_chunk_tag(
+            source_file, chunk_dimensions[file_num], chunk_offset[file_num], *chunk_args
+        )
+        features.append(sizeModel.size_features(*chunk_args))
+        sizes.append(len(tag.save_to(compressed=True)))
+    return features, sizes, [base_size] * len(sizes)
+
+
+def _relative_errors(predicted: np.ndarray, actual: np.ndarray) -> Dict[str, float]:
+    error = (predicted - actual) / actual
+    return {
+        "median_abs": round(float(np.median(np.abs(error))), 4),
+        "p95_abs": round(float(np.percentile(np.abs(error), 95)), 4),
+        "worst_under": round(float(error.min()), 4),
+        "worst_over": round(float(error.max()), 4),
+    }
+
+
+def calibrate_size_model(
+    files: List[str], block_limits: List[int]
+) -> Dict[str, object]:
+    """Fit sizeModel coefficients to the chunks of files at each block limit.
+
+    Least squares is weighted by 1 / size so small and large chunks count
+    alike in relative terms.
+    """
+    features: List[List[float]] = []
+    sizes: List[int] = []
+    bases: List[int] = []
+    for filename in files:
+        for block_limit in block_limits:
+            print(f"Sampling {filename} at {block_limit}...", file=sys.stderr)
+            with contextlib.redirect_stdout(sys.stderr):
+                f, s, b = size_samples(filename, block_limit)
+            features += f
+            sizes += s
+            bases += b
+
+    x = np.array(features, dtype=np.float64)
+    actual = np.array(sizes, dtype=np.float64)
+    base = np.array(bases, dtype=np.float64)
+    weights = 1 / actual
+    coefficients, *_ = np.linalg.lstsq(
+        x * weights[:, None], (actual - base) * weights, rcond=None
+    )
+
+    return {
+        "samples": len(sizes),
+        "block_limits": block_limits,
+        "features": list(sizeModel.FEATURES),
+        "coefficients": [float(c) for c in coefficients],
+        "fit_error": _relative_errors(base + x @ coefficients, actual),
+        "current_error": _relative_errors(
+            base + x @ np.array(sizeModel.COEFFICIENTS), actual
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark each stage of the schematic splitter."
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="Schematics to benchmark. Defaults to tests/*.schem.",
+    )
+    parser.add_argument(
+        "--block_limit",
+        type=int,
+        default=150000,
+        help="Maximum number of blocks per chunk.",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=parse_dims,
+        action="append",
+        default=[],
+        metavar="WxHxL",
+        help="Also benchmark a generated schematic of this size (repeatable).",
+    )
+    parser.add_argument(
+        "--palette-size",
+        type=int,
+        default=64,
+        help="Palette size of generated schematics.",
+    )
+    parser.add_argument(
+        "--entity-density",
+        type=float,
+        default=0.5,
+        help="Entities and block entities per 1000 blocks in generated schematics.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed for generated schematics."
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Write the JSON report to FILE instead of stdout.",
+    )
+    parser.add_argument(
+        "--compression-levels",
+        type=int,
+        nargs="+",
+        default=[1, 6, DEFAULT_LEVEL],
+        choices=range(10),
+        metavar="LEVEL",
+        help="gzip levels to time the save stage at (default: 1 6 9).",
+    )
+    parser.add_argument(
+        "--calibrate-size-model",
+        type=int,
+        nargs="*",
+        default=None,
+        metavar="BLOCK_LIMIT",
+        help=(
+            "Refit the compressed-size model instead of benchmarking, sampling "
+            "chunks at each block limit (default: 3000 10000 30000 80000 200000)."
+        ),
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        default=False,
+        help=(
+            "Also record each stage's peak Python and NumPy allocation with "
+            "tracemalloc. Slows the stages down, so compare timings only "
+            "between runs with the same setting."
+        ),
+    )
+    args = parser.parse_args()
+
+    files = args.files
+    if not files and not args.synthetic:
+        files = sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.schem")))
+
+    if args.calibrate_size_model is not None:
+        block_limits = args.calibrate_size_model or [3000, 10000, 30000, 80000, 200000]
+        text = json.dumps(calibrate_size_model(files, block_limits), indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return
+
+    scratch = tempfile.mkdtemp(prefix="splitter-bench-")
+    results = []
+    try:
+        for dims in args.synthetic:
+            path = os.path.join(scratch, "Synthetic_{}x{}x{}.schem".format(*dims))
+            make_synthetic_schematic(
+                path, dims, args.palette_size, args.entity_density, args.seed
+            )
+            files.append(path)
+
+        for filename in files:
+            print(f"Benchmarking {filename}...", file=sys.stderr)
+            run_directory = tempfile.mkdtemp(dir=scratch)
+            # A fresh process per file, so peak RSS does not carry over
+            # from the files before it
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                result = executor.submit(
+                    _benchmark_isolated,
+                    filename,
+                    args.block_limit,
+                    run_directory,
+                    args.compression_levels,
+                    args.trace_memory,
+                ).result()
+            results.append(result)
+            shutil.rmtree(run_directory, ignore_errors=True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "amulet_nbt": amulet_nbt.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,22 @@
 # schematic_splitter.py
 from math import ceil
 import os
+import time
 
 import argparse
-from typing import Dict, List, Tuple, Optional, Set
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from itertools import groupby
+from typing import Dict, Iterator, List, Tuple, Optional, Set
 
 import amulet_nbt
+import numpy as np
 from amulet_nbt import (
+    ByteTag,
     ShortTag,
     IntTag,
+    StringTag,
     DoubleTag,
     ByteArrayTag,
     IntArrayTag,
@@ -18,14 +26,54 @@ from amulet_nbt import (
 from tqdm import tqdm
 
 import schematicutil
+import parallelGzip
+import sizeModel
 import varintIterator
 import varintWriter
+import worldUtil
+from parallelGzip import CompressionPolicy
+from stageStats import StageStats
 
 AIR_BLOCK = "minecraft:air"
 CAVE_AIR_BLOCK = "minecraft:cave_air"
 VOID_AIR_BLOCK = "minecraft:void_air"
 ALL_AIR_BLOCKS = {AIR_BLOCK, CAVE_AIR_BLOCK, VOID_AIR_BLOCK}
 
+# The adaptive planner counts non-air blocks per cube of this edge, and
+# lets mostly-air boxes grow to this multiple of the block limit
+ADAPTIVE_CELL_SIZE = 16
+ADAPTIVE_VOLUME_FACTOR = 8
+
+MISSING_PALETTE_ID = "Schematic data references an ID missing from its palette."
+
+# Stages timed with StageStats.stage, which --profile can wrap in cProfile
+PROFILE_STAGES = (
+    "load",
+    "entities",
+    "block_entities",
+    "plan",
+    "decode",
+    "prescan",
+    "chunk",
+    "trim",
+    "encode",
+    "compress",
+    "encode_compress",
+    "export_entities",
+    "resplit",
+    "compress_outputs",
+    "world_group",
+    "world_patch",
+)
+
+# (lookup table from source palette ID to canonical ID, canonical ID -> name)
+CompiledPalette = Tuple[np.ndarray, List[str]]
+
+# (block volume, biome volume, block palette, biome palette) of a source
+DecodedSource = Tuple[
+    np.ndarray, Optional[np.ndarray], CompiledPalette, Optional[CompiledPalette]
+]
+
 
 def normalize_block_name(name: str) -> str:
     """Ensure block name has minecraft: prefix and strip any block state."""
@@ -35,13 +83,28 @@ def normalize_block_name(name: str) -> str:
     return base
 
 
+def normalize_block_state(block_type: str) -> str:
+    """Return a canonical form of a full block state string.
+
+    Adds the minecraft: prefix if missing and sorts the state properties, so
+    e.g. "oak_log[axis=y,waterlogged=false]" and
+    "minecraft:oak_log[waterlogged=false,axis=y]" compare equal.
+    """
+    base, _, state = block_type.partition("[")
+    base = normalize_block_name(base)
+    properties = sorted(p.strip() for p in state.rstrip("]").split(",") if p.strip())
+    if not properties:
+        return base
+    return f"{base}[{','.join(properties)}]"
+
+
 def is_air_block(block_type: str) -> bool:
     """Check if a block type string is any form of air."""
     base = block_type.split("[")[0]
     return base in ALL_AIR_BLOCKS
 
 
-def chunk_is_all_air(palette: Dict[str, IntTag]) -> bool:
+def chunk_is_all_air(palette: Dict[str, int]) -> bool:
     """Return True if every block type in the chunk palette is a form of air."""
     if not palette:
         return True
@@ -81,59 +144,456 @@ def process_entities(
     chunk_length: int,
 ) -> Dict[int, List]:
     """Process entities and distribute them into chunks."""
-    chunk_entities: Dict[int, List] = {}
-    max_cw, max_ch, max_cl = max_chunk_dims
-
-    for item in tqdm(source_entities, desc="  Entities", unit="ent", leave=True):
-        pos = item["Pos"]
-        sx, sy, sz = float(pos[0]), float(pos[1]), float(pos[2])
+    items, positions = item_positions(source_entities, "  Entities", "ent")
+    file_numbers, local = grid_cells(
+        positions, max_chunk_dims, chunk_width, chunk_length
+    )
+    return bucket_items(items, file_numbers, local)
 
-        cx = int(sx // max_cw)
-        cy = int(sy // max_ch)
-        cz = int(sz // max_cl)
 
-        file_number = schematicutil.get_index(cx, cy, cz, chunk_width, chunk_length)
+def process_block_entities(
+    source_block_entities: ListTag,
+    max_chunk_dims: Tuple[int, int, int],
+    chunk_width: int,
+    chunk_length: int,
+) -> Dict[int, List]:
+    """Process block entities and distribute them into chunks."""
+    items, positions = item_positions(
+        source_block_entities, "  Block entities", "be", np.int64
+    )
+    file_numbers, local = grid_cells(
+        positions, max_chunk_dims, chunk_width, chunk_length
+    )
+    return bucket_items(items, file_numbers, local)
 
-        local_pos = ListTag(
-            [
-                DoubleTag(sx - cx * max_cw),
-                DoubleTag(sy - cy * max_ch),
-                DoubleTag(sz - cz * max_cl),
-            ]
-        )
 
-        item["Pos"] = local_pos
-        chunk_entities.setdefault(file_number, []).append(CompoundTag(item))
+def item_positions(
+    source_items: ListTag, desc: str, unit: str, dtype: type = np.float64
+) -> Tuple[List[CompoundTag], np.ndarray]:
+    """Read the Pos of every (block) entity into one array.
 
-    return chunk_entities
+    Returns:
+        (items, positions) where positions has shape (len(items), 3).
+        Block entities should be read with an integer dtype, which makes
+        bucket_items write their local positions back as IntArrayTags.
+    """
+    items = list(source_items)
+    rows = []
+    for item in tqdm(items, desc=desc, unit=unit, leave=True):
+        pos = item["Pos"]
+        rows.append((float(pos[0]), float(pos[1]), float(pos[2])))
+    positions = np.array(rows, dtype=np.float64).reshape(-1, 3).astype(dtype)
+    return items, positions
 
 
-def process_block_entities(
-    source_block_entities: ListTag,
+def grid_cells(
+    positions: np.ndarray,
     max_chunk_dims: Tuple[int, int, int],
     chunk_width: int,
     chunk_length: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the grid chunk of each position and the position inside it.
+
+    Returns:
+        (file_numbers, local_positions)
+    """
+    dims = np.array(max_chunk_dims)
+    cells = np.floor_divide(positions, dims)
+    file_numbers = (
+        cells[:, 0]
+        + cells[:, 2] * chunk_width
+        + cells[:, 1] * chunk_width * chunk_length
+    ).astype(np.int64)
+    return file_numbers, positions - cells * dims
+
+
+def bucket_items(
+    items: List[CompoundTag], file_numbers: np.ndarray, local_positions: np.ndarray
 ) -> Dict[int, List]:
-    """Process block entities and distribute them into chunks."""
-    chunk_block_entities: Dict[int, List] = {}
+    """Group (block) entities by file number, setting Pos to local_positions.
+
+    Items are grouped with one stable sort, so each chunk keeps them in
+    source order. They are updated in place rather than copied.
+    """
+    order = np.argsort(file_numbers, kind="stable")
+    numbers = file_numbers[order]
+    starts = np.flatnonzero(np.diff(numbers, prepend=numbers[:1] - 1))
+    ends = np.append(starts[1:], numbers.size)
+
+    if np.issubdtype(local_positions.dtype, np.integer):
+        for item, pos in zip(items, local_positions.tolist()):
+            item["Pos"] = IntArrayTag(pos)
+    else:
+        for item, (x, y, z) in zip(items, local_positions.tolist()):
+            item["Pos"] = ListTag([DoubleTag(x), DoubleTag(y), DoubleTag(z)])
+
+    order = order.tolist()
+    return {
+        number: [items[i] for i in order[start:end]]
+        for number, start, end in zip(
+            numbers[starts].tolist(), starts.tolist(), ends.tolist()
+        )
+    }
+
+
+def iter_chunk_boxes(
+    source_dims: Tuple[int, int, int], max_chunk_dims: Tuple[int, int, int]
+) -> Iterator[Tuple[int, Tuple[int, int, int], Tuple[int, int, int]]]:
+    """Yield (file_number, origin, dimensions) for every chunk of the grid.
+
+    Chunks are produced in file-number order (x fastest, then z, then y).
+    Edge chunks are clipped to the source volume.
+    """
+    source_width, source_height, source_length = source_dims
     max_cw, max_ch, max_cl = max_chunk_dims
+    chunk_width = ceil(source_width / max_cw)
+    chunk_length = ceil(source_length / max_cl)
+
+    for y in range(0, source_height, max_ch):
+        for z in range(0, source_length, max_cl):
+            for x in range(0, source_width, max_cw):
+                file_number = schematicutil.get_index(
+                    x // max_cw, y // max_ch, z // max_cl, chunk_width, chunk_length
+                )
+                dims = (
+                    min(max_cw, source_width - x),
+                    min(max_ch, source_height - y),
+                    min(max_cl, source_length - z),
+                )
+                yield file_number, (x, y, z), dims
 
-    for item in tqdm(
-        source_block_entities, desc="  Block entities", unit="be", leave=True
-    ):
-        pos = item["Pos"]
-        sx, sy, sz = int(pos[0]), int(pos[1]), int(pos[2])
 
-        cx = sx // max_cw
-        cy = sy // max_ch
-        cz = sz // max_cl
+def box_layout(
+    boxes, source_offset: Tuple[int, int, int]
+) -> Tuple[Dict[int, List[int]], Dict[int, List[int]]]:
+    """Return the offset and dimensions of each (file_number, origin, dims) box."""
+    src_ox, src_oy, src_oz = source_offset
+    chunk_offset: Dict[int, List[int]] = {}
+    chunk_dimensions: Dict[int, List[int]] = {}
+    for file_number, (x, y, z), dims in boxes:
+        chunk_offset[file_number] = [x + src_ox, y + src_oy, z + src_oz]
+        chunk_dimensions[file_number] = list(dims)
+    return chunk_offset, chunk_dimensions
+
+
+def occupancy_cell_size(block_limit: int) -> int:
+    """Edge of the cubic cells used for occupancy counts.
+
+    At most ADAPTIVE_CELL_SIZE, and small enough that a single cell never
+    exceeds block_limit, so the planner can always meet the limit.
+    """
+    cell = ADAPTIVE_CELL_SIZE
+    while cell > 1 and cell**3 > block_limit:
+        cell -= 1
+    return cell
+
+
+def air_mask(palette: CompiledPalette) -> np.ndarray:
+    """Return a bool array marking which source palette IDs are air."""
+    lut, names = palette
+    # The extra entry covers IDs missing from the palette
+    is_air = np.array([is_air_block(name) for name in names] + [False])
+    return is_air[lut]
+
+
+def occupancy_grid(
+    block_volume: np.ndarray,
+    palette: CompiledPalette,
+    cell_dims: Tuple[int, int, int],
+) -> np.ndarray:
+    """Count the non-air blocks in each cell of a decoded volume.
+
+    With cell_dims set to the chunk dimensions, each cell is one chunk of
+    the grid, so this is also a cheap way to find all-air chunks before
+    cutting them out.
+
+    Args:
+        cell_dims: (width, height, length) of a cell.
+
+    Returns:
+        Counts indexed (y, z, x) by cell. Cells at the far edges cover
+        whatever is left of the volume.
+    """
+    solid = ~_lookup(air_mask(palette), block_volume)
+    counts = solid
+    cell_width, cell_height, cell_length = cell_dims
+    for axis, cell in enumerate((cell_height, cell_length, cell_width)):
+        starts = np.arange(0, block_volume.shape[axis], cell)
+        counts = np.add.reduceat(counts, starts, axis=axis, dtype=np.int64)
+    return counts
+
+
+def empty_grid_chunks(
+    boxes,
+    occupancy: np.ndarray,
+    max_chunk_dims: Tuple[int, int, int],
+    y_base: int = 0,
+) -> Set[int]:
+    """Return the file numbers of grid boxes that hold no non-air blocks.
+
+    Args:
+        occupancy: occupancy_grid counts with cell_dims = max_chunk_dims,
+                   for a volume whose first layer is source Y y_base.
+    """
+    max_cw, max_ch, max_cl = max_chunk_dims
+    return {
+        file_number
+        for file_number, (x, y, z), _ in boxes
+        if not occupancy[(y - y_base) // max_ch, z // max_cl, x // max_cw]
+    }
+
+
+def plan_adaptive_chunks(
+    occupancy: np.ndarray,
+    cell_size: int,
+    source_dims: Tuple[int, int, int],
+    block_limit: int,
+    max_volume: Optional[int] = None,
+) -> Tuple[List[Tuple[int, Tuple[int, int, int], Tuple[int, int, int]]], np.ndarray]:
+    """Split the volume into boxes that each hold a similar number of non-air blocks.
+
+    The whole volume is split k-d tree style along the longest axis, on
+    cell boundaries, until each box holds at most block_limit non-air
+    blocks and at most max_volume blocks in all. Boxes over the non-air
+    limit are cut where their non-air count is halved. Boxes that are
+    only too large are cut off at the edge of their occupied cells, so
+    empty space ends up in boxes of its own, or halved if the occupied
+    cells span the box. Together the boxes tile the volume exactly.
+
+    Args:
+        occupancy: Non-air counts per cell, from occupancy_grid.
+        max_volume: Largest box volume. Defaults to
+                    ADAPTIVE_VOLUME_FACTOR * block_limit.
 
-        file_number = schematicutil.get_index(cx, cy, cz, chunk_width, chunk_length)
+    Returns:
+        (boxes, cell_owner): boxes as (file_number, origin, dims) in
+        file-number order (sorted by y, then z, then x), and the file
+        number owning each cell, indexed (y, z, x).
+    """
+    source_width, source_height, source_length = source_dims
+    extents = (source_height, source_length, source_width)
+    if max_volume is None:
+        max_volume = ADAPTIVE_VOLUME_FACTOR * block_limit
+
+    leaves = []
+    pending = [((0, 0, 0), occupancy.shape)]
+    while pending:
+        low, high = pending.pop()
+        cells = occupancy[low[0] : high[0], low[1] : high[1], low[2] : high[2]]
+        count = int(cells.sum())
+        size = [
+            min(h * cell_size, extent) - l * cell_size
+            for l, h, extent in zip(low, high, extents)
+        ]
+        splittable = [axis for axis in range(3) if high[axis] - low[axis] > 1]
+        if not splittable or (
+            count <= block_limit and size[0] * size[1] * size[2] <= max_volume
+        ):
+            leaves.append((low, high, size))
+            continue
 
-        item["Pos"] = IntArrayTag([sx % max_cw, sy % max_ch, sz % max_cl])
-        chunk_block_entities.setdefault(file_number, []).append(CompoundTag(item))
+        axis = max(splittable, key=lambda a: size[a])
+        others = tuple(a for a in range(3) if a != axis)
+        profile = cells.sum(axis=others)
+        cut = len(profile) // 2
+        if count > block_limit:
+            cumulative = np.cumsum(profile)[:-1]
+            cut = int(np.argmin(np.abs(cumulative - count / 2))) + 1
+        elif count:
+            occupied = np.flatnonzero(profile)
+            before, after = int(occupied[0]), len(profile) - 1 - int(occupied[-1])
+            if max(before, after):
+                cut = before if before >= after else int(occupied[-1]) + 1
+
+        middle = low[axis] + cut
+        pending.append((low, tuple(middle if a == axis else high[a] for a in range(3))))
+        pending.append((tuple(middle if a == axis else low[a] for a in range(3)), high))
+
+    leaves.sort(key=lambda leaf: leaf[0])
+    boxes = []
+    cell_owner = np.empty(occupancy.shape, dtype=np.int32)
+    for file_number, (low, high, (h, l, w)) in enumerate(leaves):
+        cell_owner[low[0] : high[0], low[1] : high[1], low[2] : high[2]] = file_number
+        origin = (low[2] * cell_size, low[0] * cell_size, low[1] * cell_size)
+        boxes.append((file_number, origin, (w, h, l)))
+    return boxes, cell_owner
+
+
+def box_cells(
+    positions: np.ndarray,
+    boxes: List[Tuple[int, Tuple[int, int, int], Tuple[int, int, int]]],
+    cell_owner: np.ndarray,
+    cell_size: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the box of an adaptive plan holding each position.
+
+    Positions outside the source go to the nearest box.
 
-    return chunk_block_entities
+    Returns:
+        (file_numbers, local_positions)
+    """
+    cells = np.floor_divide(positions, cell_size).astype(np.int64)
+    height, length, width = cell_owner.shape
+    cx = np.clip(cells[:, 0], 0, width - 1)
+    cy = np.clip(cells[:, 1], 0, height - 1)
+    cz = np.clip(cells[:, 2], 0, length - 1)
+    file_numbers = cell_owner[cy, cz, cx].astype(np.int64)
+    origins = np.array([origin for _, origin, _ in boxes], dtype=np.int64)
+    return file_numbers, positions - origins.reshape(-1, 3)[file_numbers]
+
+
+def process_entities_in_boxes(
+    source_entities: ListTag,
+    boxes: List[Tuple[int, Tuple[int, int, int], Tuple[int, int, int]]],
+    cell_owner: np.ndarray,
+    cell_size: int,
+) -> Dict[int, List]:
+    """Distribute entities into the boxes of an adaptive plan."""
+    items, positions = item_positions(source_entities, "  Entities", "ent")
+    file_numbers, local = box_cells(positions, boxes, cell_owner, cell_size)
+    return bucket_items(items, file_numbers, local)
+
+
+def process_block_entities_in_boxes(
+    source_block_entities: ListTag,
+    boxes: List[Tuple[int, Tuple[int, int, int], Tuple[int, int, int]]],
+    cell_owner: np.ndarray,
+    cell_size: int,
+) -> Dict[int, List]:
+    """Distribute block entities into the boxes of an adaptive plan."""
+    items, positions = item_positions(
+        source_block_entities, "  Block entities", "be", np.int64
+    )
+    file_numbers, local = box_cells(positions, boxes, cell_owner, cell_size)
+    return bucket_items(items, file_numbers, local)
+
+
+def index_dtype(palette_size: int) -> np.dtype:
+    """Return the smallest unsigned dtype that can index palette_size entries."""
+    if palette_size <= 1 << 8:
+        return np.dtype(np.uint8)
+    if palette_size <= 1 << 16:
+        return np.dtype(np.uint16)
+    return np.dtype(np.uint32)
+
+
+def compile_palette(
+    palette_tag: CompoundTag, ignore_blocks: Optional[Set[str]] = None
+) -> CompiledPalette:
+    """Compile a source palette into an integer lookup table.
+
+    Entries that name the same block state (after normalize_block_state)
+    share one canonical ID, and ignored blocks map to the air ID, so chunk
+    remapping is a plain take over integer arrays with no string hashing.
+    Canonical names keep the spelling of their first source entry.
+
+    Args:
+        ignore_blocks: Set of base block names to map to air.
+
+    Returns:
+        (lut, names) where lut[source_id] is a canonical ID and names maps
+        canonical IDs back to block names. IDs missing from the palette
+        map to len(names).
+    """
+    source_palette = schematicutil.swap_palette(palette_tag)
+    names: List[str] = []
+    canonical_ids: Dict[str, int] = {}
+
+    def canonical_id(name: str) -> int:
+        key = normalize_block_state(name)
+        if key not in canonical_ids:
+            canonical_ids[key] = len(names)
+            names.append(name)
+        return canonical_ids[key]
+
+    mapping: Dict[int, int] = {}
+    for src_id in sorted(source_palette):
+        block_type = source_palette[src_id]
+        if ignore_blocks and normalize_block_name(block_type) in ignore_blocks:
+            block_type = AIR_BLOCK
+        mapping[src_id] = canonical_id(block_type)
+
+    size = max(mapping) + 1 if mapping else 0
+    lut = np.full(size, len(names), dtype=index_dtype(len(names) + 1))
+    for src_id, number in mapping.items():
+        lut[src_id] = number
+    return lut, names
+
+
+def remap_palette(
+    view: np.ndarray, palette: CompiledPalette
+) -> Tuple[np.ndarray, Dict[str, int]]:
+    """Remap a block of source palette IDs onto a compact local palette.
+
+    Local IDs are assigned in order of first appearance, matching the order
+    a linear x/z/y scan of the chunk would discover them. Source IDs that
+    share a canonical ID (e.g. ignored blocks mapped to air) share a local
+    ID.
+
+    Returns:
+        (flat local index array in the smallest fitting dtype,
+         local palette as {name: id})
+    """
+    lut, names = palette
+    unique_ids, first_seen, inverse = np.unique(
+        _lookup(lut, view), return_index=True, return_inverse=True
+    )
+    if unique_ids.size and unique_ids[-1] >= len(names):
+        raise ValueError(MISSING_PALETTE_ID)
+    order = np.argsort(first_seen)
+    local_ids = np.empty(len(unique_ids), dtype=index_dtype(len(unique_ids)))
+    local_ids[order] = np.arange(len(unique_ids))
+
+    local_palette = {
+        names[number]: i for i, number in enumerate(unique_ids[order].tolist())
+    }
+    return local_ids[inverse.reshape(-1)], local_palette
+
+
+def _lookup(lut: np.ndarray, view: np.ndarray) -> np.ndarray:
+    """Map source IDs to canonical IDs with a single take."""
+    try:
+        return lut.take(view)
+    except IndexError:
+        raise ValueError(MISSING_PALETTE_ID) from None
+
+
+def remap_biomes(
+    view: np.ndarray, biome_palette: CompiledPalette
+) -> Tuple[np.ndarray, Dict[str, int]]:
+    """Remap a chunk of biome IDs, short-cutting chunks with a single biome.
+
+    Almost every build has one or two biomes, so most chunks are uniform.
+    Those get a zero-stride constant index array and a one-entry palette
+    without any per-block work.
+    """
+    lut, names = biome_palette
+    first = int(view.flat[0])
+    if not any(view.strides) or (view == first).all():
+        (number,) = _lookup(lut, np.array([first]))
+        if number >= len(names):
+            raise ValueError(MISSING_PALETTE_ID)
+        return _constant_indices(view.size), {names[number]: 0}
+    return remap_palette(view, biome_palette)
+
+
+def _constant_indices(count: int) -> np.ndarray:
+    """Return a read-only all-zero index array that takes no memory."""
+    return np.broadcast_to(np.uint8(0), (count,))
+
+
+def _uniform_volume(
+    palette: CompiledPalette, volume_shape: Tuple[int, int, int]
+) -> Optional[np.ndarray]:
+    """Return a zero-stride volume if the palette has one entry, else None.
+
+    A single-entry palette means every ID in the data is that entry, so
+    the data does not need to be decoded at all.
+    """
+    lut, names = palette
+    if len(names) != 1 or (lut != 0).any():
+        return None
+    return np.broadcast_to(np.uint32(0), volume_shape)
 
 
 def process_chunk_data(
@@ -145,155 +605,289 @@ def process_chunk_data(
     chunk_width: int,
     chunk_length: int,
     ignore_blocks: Optional[Set[str]] = None,
+    stats: Optional[StageStats] = None,
+    skip_air: bool = False,
 ) -> Tuple[Dict, ...]:
     """Process blocks, palette, and biome data into chunks.
 
+    The source volume is decoded once into a (height, length, width) array
+    and each chunk is cut out of it as a sub-array view.
+
     Args:
         ignore_blocks: Set of base block names (e.g. "minecraft:stone") to replace
                        with air in the output chunks.
+        stats: If given, records the "decode", "prescan" and "chunk" stages.
+        skip_air: If True, find all-air chunks from a per-chunk occupancy
+                  count first and leave them as placeholders (see
+                  chunk_boxes) instead of remapping them.
+    """
+    stats = stats if stats is not None else StageStats()
+    decoded = decode_source(
+        source_blocks, source_biomes, source_dims, ignore_blocks, stats
+    )
+    boxes = list(iter_chunk_boxes(source_dims, max_chunk_dims))
+    empty = None
+    if skip_air:
+        with stats.stage("prescan", blocks=decoded[0].size):
+            occupancy = occupancy_grid(decoded[0], decoded[2], max_chunk_dims)
+            empty = empty_grid_chunks(boxes, occupancy, max_chunk_dims)
+    return chunk_boxes(decoded, boxes, source_offset, stats, empty)
+
+
+def byte_view(data) -> np.ndarray:
+    """View a ByteArrayTag's signed bytes as uint8 without copying them.
+
+    Also accepts the int8 arrays returned by the lazy loader.
+    """
+    return np.asarray(getattr(data, "np_array", data)).view(np.uint8)
+
+
+def decode_source(
+    source_blocks: CompoundTag,
+    source_biomes: Optional[CompoundTag],
+    source_dims: Tuple[int, int, int],
+    ignore_blocks: Optional[Set[str]] = None,
+    stats: Optional[StageStats] = None,
+) -> DecodedSource:
+    """Decode the whole block (and biome) volume of the source.
+
+    Args:
+        ignore_blocks: Set of base block names to map to air.
+        stats: If given, records the "decode" stage.
+
+    Returns:
+        (block volume, biome volume or None, compiled block palette,
+         compiled biome palette or None), volumes indexed (y, z, x).
     """
+    stats = stats if stats is not None else StageStats()
     source_width, source_height, source_length = source_dims
-    src_ox, src_oy, src_oz = source_offset
-    max_cw, max_ch, max_cl = max_chunk_dims
+    volume_shape = (source_height, source_length, source_width)
+    source_palette, source_biome_palette = _source_palettes(
+        source_blocks, source_biomes, ignore_blocks
+    )
 
+    raw_blocks = source_blocks["Data"]
     total_blocks = source_width * source_height * source_length
-
-    chunk: Dict[int, List[int]] = {0: []}
-    chunk_palette: Dict[int, Dict[str, IntTag]] = {0: {}}
-    chunk_offset: Dict[int, List[int]] = {0: [src_ox, src_oy, src_oz]}
-    chunk_dimensions: Dict[int, List[int]] = {0: [max_cw, max_ch, max_cl]}
-
-    has_biomes = source_biomes is not None
-    chunk_biomes: Optional[Dict[int, List[int]]] = None
-    chunk_biomes_palette: Optional[Dict[int, Dict[str, IntTag]]] = None
-
-    if has_biomes:
-        chunk_biomes = {0: []}
-        chunk_biomes_palette = {0: {}}
-        raw_biome = source_biomes["Data"]
-        biome_data = bytes(
-            b & 0xFF
-            for b in tqdm(
-                raw_biome,
-                desc="  Loading biome data",
-                unit="B",
-                unit_scale=True,
-                leave=True,
+    with stats.stage("decode", blocks=total_blocks, bytes_in=len(raw_blocks)):
+        biome_volume = None
+        if source_biomes is not None:
+            biome_volume = _uniform_volume(source_biome_palette, volume_shape)
+        if biome_volume is None and source_biomes is not None:
+            biome_volume = _decode_volume(
+                varintIterator.decode(byte_view(source_biomes["Data"])),
+                volume_shape,
+                "biome",
             )
-        )
-        source_biome_palette = schematicutil.swap_palette(source_biomes["Palette"])
-        biome_iter = varintIterator.VarIntIterator(biome_data)
 
-    raw_blocks = source_blocks["Data"]
-    block_data = bytes(
-        b & 0xFF
-        for b in tqdm(
-            raw_blocks,
-            desc="  Loading block data",
-            unit="B",
-            unit_scale=True,
-            leave=True,
+        block_volume = _decode_volume(
+            varintIterator.decode(byte_view(raw_blocks)), volume_shape, "block"
         )
-    )
-    source_palette = schematicutil.swap_palette(source_blocks["Palette"])
-    block_iter = varintIterator.VarIntIterator(block_data)
 
-    # Pre-compute which source palette IDs should be replaced with air
-    ignored_source_ids: Set[int] = set()
-    if ignore_blocks:
-        for src_id, block_type in source_palette.items():
-            base_name = block_type.split("[")[0]
-            if base_name in ignore_blocks:
-                ignored_source_ids.add(src_id)
+    return block_volume, biome_volume, source_palette, source_biome_palette
 
-    progress = tqdm(
-        total=total_blocks, desc="  Blocks", unit="blk", unit_scale=True, leave=True
-    )
 
-    source_index = 0
-    while block_iter.has_next():
-        sx, sy, sz = schematicutil.get_local_coordinate(
-            source_index, source_width, source_length
+def chunk_boxes(
+    decoded: DecodedSource,
+    boxes: List[Tuple[int, Tuple[int, int, int], Tuple[int, int, int]]],
+    source_offset: Tuple[int, int, int],
+    stats: Optional[StageStats] = None,
+    empty: Optional[Set[int]] = None,
+) -> Tuple[Dict, ...]:
+    """Cut (file_number, origin, dims) boxes out of a decoded source.
+
+    Args:
+        stats: If given, records the "chunk" stage.
+        empty: File numbers of boxes known to hold only air. These are not
+               cut out or remapped: they get their offset and dimensions, a
+               zero-memory index array with an air palette, and no biomes,
+               so that skip_air drops them without further work.
+
+    Returns:
+        Chunk data in the layout of process_chunk_data.
+    """
+    stats = stats if stats is not None else StageStats()
+    block_volume, biome_volume, source_palette, source_biome_palette = decoded
+    chunk_data = _empty_chunk_data(source_biome_palette is not None)
+    with stats.stage("chunk", blocks=block_volume.size):
+        _cut_chunks(
+            chunk_data,
+            tqdm(boxes, desc="  Chunks", unit="chunk", leave=True),
+            0,
+            block_volume,
+            biome_volume,
+            source_offset,
+            source_palette,
+            source_biome_palette,
+            empty,
         )
+    return chunk_data
 
-        cx = sx // max_cw
-        cy = sy // max_ch
-        cz = sz // max_cl
-
-        file_number = schematicutil.get_index(cx, cy, cz, chunk_width, chunk_length)
-
-        x_width = (sx % max_cw) + 1
-        y_height = (sy % max_ch) + 1
-        z_length = (sz % max_cl) + 1
-
-        # Initialize new chunk data if needed
-        if file_number not in chunk:
-            chunk[file_number] = []
-            chunk_palette[file_number] = {}
-            chunk_offset[file_number] = [
-                sx + src_ox,
-                sy + src_oy,
-                sz + src_oz,
-            ]
-            chunk_dimensions[file_number] = [x_width, y_height, z_length]
-
-            if has_biomes:
-                chunk_biomes[file_number] = []
-                chunk_biomes_palette[file_number] = {}
-
-        # Update chunk dimensions to track maximums
-        dims = chunk_dimensions[file_number]
-        if x_width > dims[0]:
-            dims[0] = x_width
-        if y_height > dims[1]:
-            dims[1] = y_height
-        if z_length > dims[2]:
-            dims[2] = z_length
-
-        # Process block data
-        new_block_id = next(block_iter)
-
-        # Replace ignored blocks with air
-        if ignored_source_ids and new_block_id in ignored_source_ids:
-            block_type = AIR_BLOCK
-        else:
-            block_type = source_palette[new_block_id]
 
-        palette = chunk_palette[file_number]
-        if block_type not in palette:
-            block_number = len(palette)
-            palette[block_type] = IntTag(block_number)
-        else:
-            block_number = int(palette[block_type])
-
-        chunk[file_number].append(block_number)
-
-        # Process biome data if present
-        if has_biomes:
-            new_biome_id = next(biome_iter)
-            biome_type = source_biome_palette[new_biome_id]
-            b_palette = chunk_biomes_palette[file_number]
-            if biome_type not in b_palette:
-                biome_number = len(b_palette)
-                b_palette[biome_type] = IntTag(biome_number)
-            else:
-                biome_number = int(b_palette[biome_type])
-            chunk_biomes[file_number].append(biome_number)
-            biome_iter.has_next()
+def iter_chunk_bands(
+    source_blocks: CompoundTag,
+    source_biomes: Optional[CompoundTag],
+    max_chunk_dims: Tuple[int, int, int],
+    source_dims: Tuple[int, int, int],
+    source_offset: Tuple[int, int, int],
+    ignore_blocks: Optional[Set[str]] = None,
+    stats: Optional[StageStats] = None,
+    skip_air: bool = False,
+) -> Iterator[Tuple[Dict, ...]]:
+    """Stream chunk data one horizontal band (layer of chunks) at a time.
 
-        source_index += 1
-        progress.update(1)
+    Block and biome data are decoded incrementally, reading only the VarInts
+    covering the current band, so the decoded arrays hold one chunk layer
+    rather than the whole schematic. The encoded data itself is read where
+    it lies and must already be in memory. Each yielded tuple has the same
+    layout as the result of process_chunk_data.
+
+    Args:
+        stats: If given, records the "decode", "prescan" and "chunk" stages
+               per band.
+        skip_air: If True, leave all-air chunks of each band as placeholders
+                  (see process_chunk_data).
+    """
+    stats = stats if stats is not None else StageStats()
+    source_width, source_height, source_length = source_dims
+    layer_size = source_width * source_length
+    source_palette, source_biome_palette = _source_palettes(
+        source_blocks, source_biomes, ignore_blocks
+    )
+
+    block_data = byte_view(source_blocks["Data"])
+    biome_data = None
+    if source_biomes is not None and len(source_biome_palette[1]) > 1:
+        biome_data = byte_view(source_biomes["Data"])
+    block_pos = biome_pos = 0
+
+    boxes = iter_chunk_boxes(source_dims, max_chunk_dims)
+    for band_y, band_group in groupby(boxes, key=lambda box: box[1][1]):
+        band_boxes = list(band_group)
+        band_height = min(max_chunk_dims[1], source_height - band_y)
+        band_shape = (band_height, source_length, source_width)
+        count = band_height * layer_size
+
+        with stats.stage("decode", blocks=count) as counters:
+            start = block_pos
+            ids, block_pos = varintIterator.decode_count(block_data, count, block_pos)
+            counters["bytes_in"] = block_pos - start
+            block_volume = _decode_volume(ids, band_shape, "block")
+            biome_volume = None
+            if biome_data is not None:
+                ids, biome_pos = varintIterator.decode_count(
+                    biome_data, count, biome_pos
+                )
+                biome_volume = _decode_volume(ids, band_shape, "biome")
+            elif source_biomes is not None:
+                biome_volume = _uniform_volume(source_biome_palette, band_shape)
+
+        empty = None
+        if skip_air:
+            with stats.stage("prescan", blocks=count):
+                occupancy = occupancy_grid(block_volume, source_palette, max_chunk_dims)
+                empty = empty_grid_chunks(band_boxes, occupancy, max_chunk_dims, band_y)
+
+        chunk_data = _empty_chunk_data(source_biomes is not None)
+        with stats.stage("chunk", blocks=count):
+            _cut_chunks(
+                chunk_data,
+                band_boxes,
+                band_y,
+                block_volume,
+                biome_volume,
+                source_offset,
+                source_palette,
+                source_biome_palette,
+                empty,
+            )
+        yield chunk_data
+
+
+def _source_palettes(
+    source_blocks: CompoundTag,
+    source_biomes: Optional[CompoundTag],
+    ignore_blocks: Optional[Set[str]],
+) -> Tuple[CompiledPalette, Optional[CompiledPalette]]:
+    """Compile the block and biome palettes of the source."""
+    source_palette = compile_palette(source_blocks["Palette"], ignore_blocks)
+    source_biome_palette = None
+    if source_biomes is not None:
+        source_biome_palette = compile_palette(source_biomes["Palette"])
+    return source_palette, source_biome_palette
 
-    progress.close()
 
+def _empty_chunk_data(has_biomes: bool) -> Tuple[Dict, ...]:
     return (
+        {},  # chunk
+        {},  # chunk_palette
+        {},  # chunk_offset
+        {},  # chunk_dimensions
+        {} if has_biomes else None,  # chunk_biomes
+        {} if has_biomes else None,  # chunk_biomes_palette
+    )
+
+
+def _cut_chunks(
+    chunk_data: Tuple[Dict, ...],
+    boxes,
+    y_base: int,
+    block_volume: np.ndarray,
+    biome_volume: Optional[np.ndarray],
+    source_offset: Tuple[int, int, int],
+    source_palette: CompiledPalette,
+    source_biome_palette: Optional[CompiledPalette],
+    empty: Optional[Set[int]] = None,
+) -> None:
+    """Slice each chunk box out of the decoded volume(s) into chunk_data.
+
+    y_base is the source Y of the first layer held in the volumes. Boxes in
+    empty are left as air placeholders (see chunk_boxes).
+    """
+    (
         chunk,
         chunk_palette,
         chunk_offset,
         chunk_dimensions,
         chunk_biomes,
         chunk_biomes_palette,
-    )
+    ) = chunk_data
+    src_ox, src_oy, src_oz = source_offset
+
+    for file_number, (x, y, z), (w, h, l) in boxes:
+        region = (
+            slice(y - y_base, y - y_base + h),
+            slice(z, z + l),
+            slice(x, x + w),
+        )
+
+        chunk_offset[file_number] = [x + src_ox, y + src_oy, z + src_oz]
+        chunk_dimensions[file_number] = [w, h, l]
+        if empty and file_number in empty:
+            chunk[file_number] = _constant_indices(w * h * l)
+            chunk_palette[file_number] = {AIR_BLOCK: 0}
+            continue
+        chunk[file_number], chunk_palette[file_number] = remap_palette(
+            block_volume[region], source_palette
+        )
+
+        if biome_volume is not None:
+            (
+                chunk_biomes[file_number],
+                chunk_biomes_palette[file_number],
+            ) = remap_biomes(biome_volume[region], source_biome_palette)
+
+
+def _decode_volume(
+    ids: np.ndarray, volume_shape: Tuple[int, int, int], kind: str
+) -> np.ndarray:
+    """Reshape decoded IDs into a (height, length, width) array."""
+    expected = volume_shape[0] * volume_shape[1] * volume_shape[2]
+    if ids.size != expected:
+        raise ValueError(
+            f"Schematic {kind} data holds {ids.size} entries, "
+            f"expected {expected} from its dimensions."
+        )
+    return ids.reshape(volume_shape)
 
 
 def export_entities_file(
@@ -304,21 +898,24 @@ def export_entities_file(
     chunk_dimensions: Dict[int, List[int]],
     output_directory: str,
     output_name: str,
+    compression: Optional[CompressionPolicy] = None,
 ) -> List[str]:
     """Export entities and block entities as separate schematic files.
 
     Each chunk that contains entities or block entities gets its own .schem
     file with all-air blocks and the entities embedded.
 
+    Args:
+        compression: How the files are compressed. Defaults to gzip level 9.
+
     Returns:
         List of written entity schematic file paths.
     """
     os.makedirs(output_directory, exist_ok=True)
 
-    root = source_file.compound
-    schematic = root["Schematic"]
-    blocks = schematic["Blocks"]
-    has_biomes = "Biomes" in schematic
+    has_biomes = schematicutil.get_biome_data(source_file) is not None
+    air_palette = {AIR_BLOCK: 0}
+    plains_palette = {"minecraft:plains": 0}
 
     # Collect all chunk indices that have any entities
     entity_chunks = sorted(
@@ -334,38 +931,29 @@ def export_entities_file(
         dims = chunk_dimensions.get(file_num)
         if dims is None:
             continue
-        w, h, l = dims[0], dims[1], dims[2]
-
-        schematic["Width"] = ShortTag(w)
-        schematic["Height"] = ShortTag(h)
-        schematic["Length"] = ShortTag(l)
 
-        # Entities
-        e_list = chunk_entities.get(file_num)
-        schematic["Entities"] = ListTag(e_list) if e_list else ListTag()
-
-        be_list = chunk_block_entities.get(file_num)
-        blocks["BlockEntities"] = ListTag(be_list) if be_list else ListTag()
-
-        # All-air block data
-        air_palette = {AIR_BLOCK: IntTag(0)}
-        air_data = [0] * (w * h * l)
-        blocks["Data"] = ByteArrayTag(varintWriter.write(air_data, w, h, l))
-        blocks["Palette"] = CompoundTag(air_palette)
-
-        # Biomes (minimal placeholder so the file is valid)
-        if has_biomes:
-            biomes = schematic["Biomes"]
-            biomes["Data"] = ByteArrayTag(varintWriter.write(air_data, w, h, l))
-            biomes["Palette"] = CompoundTag({"minecraft:plains": IntTag(0)})
-
-        offset = chunk_offsets.get(file_num, [0, 0, 0])
-        schematic["Offset"] = IntArrayTag(offset)
+        # All-air block data, with a minimal biome placeholder so the file
+        # is valid
+        air_data = np.zeros(dims[0] * dims[1] * dims[2], dtype=np.uint8)
+        chunk_tag = build_chunk_tag(
+            source_file,
+            dims,
+            chunk_offsets.get(file_num, [0, 0, 0]),
+            air_data,
+            air_palette,
+            air_data if has_biomes else None,
+            plains_palette if has_biomes else None,
+            chunk_block_entities.get(file_num),
+            chunk_entities.get(file_num),
+        )
 
         output_location = os.path.join(
             output_directory, f"{output_name}_entities{output_index}.schem"
         )
-        source_file.save_to(output_location, compressed=True)
+        _write_payload(
+            output_location,
+            encode_tag(chunk_tag, compression),
+        )
         written_files.append(output_location)
         output_index += 1
 
@@ -373,6 +961,429 @@ def export_entities_file(
     return written_files
 
 
+def build_chunk_tag(
+    source_file: amulet_nbt.NamedTag,
+    dims: List[int],
+    offset: List[int],
+    block_indices,
+    block_palette: Dict[str, int],
+    biome_indices=None,
+    biome_palette: Optional[Dict[str, int]] = None,
+    block_entities: Optional[List] = None,
+    entities: Optional[List] = None,
+) -> amulet_nbt.NamedTag:
+    """Build the NBT for one output chunk without modifying source_file.
+
+    The root, Schematic, Blocks and Biomes compounds are shallow-copied so
+    chunks can be built independently (and in worker processes). Palettes
+    are plain {name: id} dicts and only become IntTags here.
+    """
+    root = CompoundTag(source_file.compound)
+    schematic = root["Schematic"] = CompoundTag(root["Schematic"])
+    blocks = schematic["Blocks"] = CompoundTag(schematic["Blocks"])
+    w, h, l = dims[0], dims[1], dims[2]
+
+    schematic["Width"] = ShortTag(w)
+    schematic["Height"] = ShortTag(h)
+    schematic["Length"] = ShortTag(l)
+
+    blocks["BlockEntities"] = ListTag(block_entities) if block_entities else ListTag()
+    schematic["Entities"] = ListTag(entities) if entities else ListTag()
+
+    # Block data
+    blocks["Data"] = ByteArrayTag(varintWriter.write(block_indices, w, h, l))
+    blocks["Palette"] = _palette_tag(block_palette)
+
+    # Biomes
+    if biome_indices is not None and "Biomes" in schematic:
+        biomes = schematic["Biomes"] = CompoundTag(schematic["Biomes"])
+        biomes["Data"] = ByteArrayTag(varintWriter.write(biome_indices, w, h, l))
+        biomes["Palette"] = _palette_tag(biome_palette)
+
+    schematic["Offset"] = IntArrayTag(offset)
+
+    return amulet_nbt.NamedTag(root, source_file.name)
+
+
+def split_to_size(
+    source_file: amulet_nbt.NamedTag,
+    max_file_size: int,
+    dims: List[int],
+    offset: List[int],
+    block_indices,
+    block_palette: Dict[str, int],
+    biome_indices=None,
+    biome_palette: Optional[Dict[str, int]] = None,
+    block_entities: Optional[List] = None,
+    entities: Optional[List] = None,
+    skip_air: bool = False,
+    base_size: Optional[int] = None,
+    compression: Optional[CompressionPolicy] = None,
+) -> List[bytes]:
+    """Encode a chunk as gzipped schematics of at most max_file_size bytes.
+
+    The compressed size is first estimated with sizeModel. While the
+    estimate is over the cap, the chunk is bisected along its longest axis
+    without compressing anything, working from the already decoded index
+    arrays. Each piece the model expects to fit is then compressed in
+    memory, and one that turns out too large after all is bisected in turn.
+    A single block that is still too large (e.g. because of its entities)
+    is kept as is.
+
+    Args:
+        base_size: Compressed size of an empty chunk from source_file (see
+                   chunk_base_size). Computed here if not given.
+        compression: How the payloads are compressed. max_file_size
+                     applies to them as encoded.
+
+    Returns:
+        Compressed schematic payloads, in output order.
+    """
+    if skip_air and chunk_is_all_air(block_palette):
+        return []
+    if base_size is None:
+        base_size = chunk_base_size(source_file, compression)
+
+    chunk_args = (
+        dims,
+        offset,
+        block_indices,
+        block_palette,
+        biome_indices,
+        biome_palette,
+        block_entities,
+        entities,
+    )
+    predicted = sizeModel.predict_size(base_size, *chunk_args[2:])
+    if predicted <= max_file_size or _volume(dims) == 1:
+        payload = encode_tag(build_chunk_tag(source_file, *chunk_args), compression)
+        if len(payload) <= max_file_size:
+            return [payload]
+        if _volume(dims) == 1:
+            print(
+                f"Warning: the single block at {offset} still encodes to "
+                f"{len(payload)} bytes, over the {max_file_size} byte limit."
+            )
+            return [payload]
+
+    payloads: List[bytes] = []
+    for half in bisect_chunk(*chunk_args):
+        payloads += split_to_size(
+            source_file,
+            max_file_size,
+            *half,
+            skip_air=skip_air,
+            base_size=base_size,
+            compression=compression,
+        )
+    return payloads
+
+
+def chunk_base_size(
+    source_file: amulet_nbt.NamedTag,
+    compression: Optional[CompressionPolicy] = None,
+) -> int:
+    """Return the compressed size of an empty one-block chunk of source_file.
+
+    This is the per-file overhead (metadata, tag names, gzip header) that
+    sizeModel.predict_size adds its estimate to.
+    """
+    has_biomes = "Biomes" in source_file.compound["Schematic"]
+    payload = encode_tag(
+        build_chunk_tag(
+            source_file,
+            [1, 1, 1],
+            [0, 0, 0],
+            _constant_indices(1),
+            {AIR_BLOCK: 0},
+            _constant_indices(1) if has_biomes else None,
+            {"minecraft:plains": 0} if has_biomes else None,
+        ),
+        compression,
+    )
+    return len(payload)
+
+
+def bisect_chunk(
+    dims: List[int],
+    offset: List[int],
+    block_indices,
+    block_palette: Dict[str, int],
+    biome_indices=None,
+    biome_palette: Optional[Dict[str, int]] = None,
+    block_entities: Optional[List] = None,
+    entities: Optional[List] = None,
+) -> Tuple[Tuple, Tuple]:
+    """Split a chunk in two along its longest axis.
+
+    Index arrays are sliced and their palettes compacted. Entities and block
+    entities go to the half containing them, with positions made relative
+    to that half.
+
+    Returns:
+        Two tuples in build_chunk_tag argument order (dims onwards).
+    """
+    w, h, l = dims
+    axis = max(range(3), key=lambda i: dims[i])
+    mid = dims[axis] // 2
+    volume_axis = (2, 0, 1)[axis]  # volumes are indexed (y, z, x)
+
+    blocks = np.reshape(block_indices, (h, l, w))
+    biomes = None
+    if biome_indices is not None:
+        biomes = np.reshape(biome_indices, (h, l, w))
+    be_halves = _split_items(block_entities, axis, mid)
+    e_halves = _split_items(entities, axis, mid)
+
+    halves = []
+    for side, (start, stop) in enumerate(((0, mid), (mid, dims[axis]))):
+        region = [slice(None)] * 3
+        region[volume_axis] = slice(start, stop)
+        region = tuple(region)
+
+        half_dims = list(dims)
+        half_dims[axis] = stop - start
+        half_offset = list(offset)
+        half_offset[axis] += start
+
+        indices, palette = remap_palette(blocks[region], _compiled(block_palette))
+        half_biomes = half_biome_palette = None
+        if biomes is not None:
+            half_biomes, half_biome_palette = remap_biomes(
+                biomes[region], _compiled(biome_palette)
+            )
+        halves.append(
+            (
+                half_dims,
+                half_offset,
+                indices,
+                palette,
+                half_biomes,
+                half_biome_palette,
+                be_halves[side],
+                e_halves[side],
+            )
+        )
+    return halves[0], halves[1]
+
+
+def trim_chunk(
+    dims: List[int],
+    offset: List[int],
+    block_indices,
+    block_palette: Dict[str, int],
+    biome_indices=None,
+    biome_palette: Optional[Dict[str, int]] = None,
+    block_entities: Optional[List] = None,
+    entities: Optional[List] = None,
+) -> Optional[Tuple]:
+    """Shrink a chunk to the bounding box of its non-air blocks and entities.
+
+    The box is found from the projections of a vectorized non-air mask, then
+    widened to take in the block of every entity and block entity so none
+    end up outside the file. Offset moves with the box, so the contents
+    stay at the same world position.
+
+    Returns:
+        The trimmed chunk in build_chunk_tag argument order (dims onwards),
+        the arguments unchanged if there is no air to trim, or None if the
+        chunk holds only air and no entities.
+    """
+    chunk_args = (
+        dims,
+        offset,
+        block_indices,
+        block_palette,
+        biome_indices,
+        biome_palette,
+        block_entities,
+        entities,
+    )
+    w, h, l = dims
+    names = sorted(block_palette, key=block_palette.get)
+    is_air = np.array([is_air_block(name) for name in names], dtype=bool)
+    if names and not is_air.any():
+        return chunk_args
+
+    blocks = np.reshape(block_indices, (h, l, w))
+    low = [None, None, None]
+    high = [None, None, None]
+    if names and not is_air.all():
+        solid = ~is_air[blocks]
+        # (y, z, x) volume axes for x, y and z
+        for axis, others in enumerate(((0, 1), (1, 2), (0, 2))):
+            occupied = np.flatnonzero(solid.any(axis=others))
+            low[axis], high[axis] = int(occupied[0]), int(occupied[-1]) + 1
+
+    for item in (block_entities or []) + (entities or []):
+        pos = item["Pos"]
+        for axis in range(3):
+            cell = min(max(int(float(pos[axis]) // 1), 0), dims[axis] - 1)
+            low[axis] = cell if low[axis] is None else min(low[axis], cell)
+            high[axis] = cell + 1 if high[axis] is None else max(high[axis], cell + 1)
+
+    if low[0] is None:
+        return None
+    if low == [0, 0, 0] and high == list(dims):
+        return chunk_args
+
+    region = (slice(low[1], high[1]), slice(low[2], high[2]), slice(low[0], high[0]))
+    trimmed_indices, trimmed_palette = remap_palette(
+        blocks[region], _compiled(block_palette)
+    )
+    trimmed_biomes = trimmed_biome_palette = None
+    if biome_indices is not None:
+        trimmed_biomes, trimmed_biome_palette = remap_biomes(
+            np.reshape(biome_indices, (h, l, w))[region], _compiled(biome_palette)
+        )
+    return (
+        [high[axis] - low[axis] for axis in range(3)],
+        [offset[axis] + low[axis] for axis in range(3)],
+        trimmed_indices,
+        trimmed_palette,
+        trimmed_biomes,
+        trimmed_biome_palette,
+        [_shift_item(item, low) for item in block_entities] if block_entities else None,
+        [_shift_item(item, low) for item in entities] if entities else None,
+    )
+
+
+def _compiled(palette: Dict[str, int]) -> CompiledPalette:
+    """View a local {name: id} palette as an identity CompiledPalette."""
+    names = sorted(palette, key=palette.get)
+    return np.arange(len(names), dtype=index_dtype(len(names))), names
+
+
+def _split_items(
+    items: Optional[List], axis: int, mid: int
+) -> Tuple[Optional[List], Optional[List]]:
+    """Divide (block) entities at mid along axis, shifting the upper half."""
+    if not items:
+        return None, None
+    lower: List = []
+    upper: List = []
+    shift = [mid if i == axis else 0 for i in range(3)]
+    for item in items:
+        if float(item["Pos"][axis]) < mid:
+            lower.append(item)
+        else:
+            upper.append(_shift_item(item, shift))
+    return lower or None, upper or None
+
+
+def _shift_item(item: CompoundTag, shift: List[int]) -> CompoundTag:
+    """Return a copy of a (block) entity with shift subtracted from its Pos."""
+    pos = item["Pos"]
+    moved = CompoundTag(item)
+    if isinstance(pos, IntArrayTag):
+        moved["Pos"] = IntArrayTag([int(v) - d for v, d in zip(pos, shift)])
+    else:
+        moved["Pos"] = ListTag([DoubleTag(float(v) - d) for v, d in zip(pos, shift)])
+    return moved
+
+
+def _volume(dims: List[int]) -> int:
+    return dims[0] * dims[1] * dims[2]
+
+
+def _palette_tag(palette: Dict[str, int]) -> CompoundTag:
+    return CompoundTag({name: IntTag(number) for name, number in palette.items()})
+
+
+def _chunk_template(source_file: amulet_nbt.NamedTag) -> bytes:
+    """Serialize source_file with its bulk data emptied, for shipping to workers.
+
+    Keys are overwritten rather than removed so the field order of the
+    written files matches the serial writer. Tags travel as raw NBT because
+    pickling loses the element type of empty ListTags.
+    """
+    root = CompoundTag(source_file.compound)
+    schematic = root["Schematic"] = CompoundTag(root["Schematic"])
+    blocks = schematic["Blocks"] = CompoundTag(schematic["Blocks"])
+    blocks["Data"] = ByteArrayTag()
+    if "BlockEntities" in blocks:
+        blocks["BlockEntities"] = ListTag()
+    if "Entities" in schematic:
+        schematic["Entities"] = ListTag()
+    if "Biomes" in schematic:
+        biomes = schematic["Biomes"] = CompoundTag(schematic["Biomes"])
+        biomes["Data"] = ByteArrayTag()
+    return amulet_nbt.NamedTag(root, source_file.name).save_to(compressed=False)
+
+
+def _pack_tag_list(items: Optional[List]) -> Optional[bytes]:
+    if not items:
+        return None
+    return amulet_nbt.NamedTag(ListTag(items)).save_to(compressed=False)
+
+
+def _unpack_tag_list(data: Optional[bytes]) -> Optional[List]:
+    if data is None:
+        return None
+    return list(amulet_nbt.load(data, compressed=False).list)
+
+
+_worker_template: Optional[amulet_nbt.NamedTag] = None
+
+
+def _init_chunk_writer(template: bytes) -> None:
+    global _worker_template
+    _worker_template = amulet_nbt.load(template, compressed=False)
+
+
+def chunk_writer_pool(
+    source_file: amulet_nbt.NamedTag, jobs: int
+) -> ProcessPoolExecutor:
+    """Start jobs worker processes holding the chunk template of source_file."""
+    return ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_chunk_writer,
+        initargs=(_chunk_template(source_file),),
+    )
+
+
+def _encode_sized_chunk(job: Tuple) -> List[bytes]:
+    """Worker entry point: encode and compress one chunk under a size cap."""
+    max_file_size, skip_air, base_size, compression, *chunk_args = job
+    *chunk_args, be_data, e_data = chunk_args
+    return split_to_size(
+        _worker_template,
+        max_file_size,
+        *chunk_args,
+        _unpack_tag_list(be_data),
+        _unpack_tag_list(e_data),
+        skip_air=skip_air,
+        base_size=base_size,
+        compression=compression,
+    )
+
+
+def encode_tag(
+    tag: amulet_nbt.NamedTag, compression: Optional[CompressionPolicy] = None
+) -> bytes:
+    """Serialize a tag as it is written to disk under compression."""
+    compression = compression or CompressionPolicy()
+    return compression.encode(tag.save_to(compressed=False))
+
+
+def _write_payload(output_location: str, payload: bytes) -> str:
+    with open(output_location, "wb") as f:
+        f.write(payload)
+    return output_location
+
+
+def _write_chunk_file(job: Tuple) -> str:
+    """Worker entry point: encode, compress and save one chunk."""
+    output_location, compression, *chunk_args, be_data, e_data = job
+    chunk_tag = build_chunk_tag(
+        _worker_template,
+        *chunk_args,
+        _unpack_tag_list(be_data),
+        _unpack_tag_list(e_data),
+    )
+    return _write_payload(output_location, encode_tag(chunk_tag, compression))
+
+
 def write_chunks(
     source_file: amulet_nbt.NamedTag,
     chunk_data: Tuple[Dict, ...],
@@ -382,8 +1393,41 @@ def write_chunks(
     output_name: str,
     skip_air: bool = False,
     export_entities: bool = False,
+    jobs: int = 1,
+    first_index: int = 0,
+    stats: Optional[StageStats] = None,
+    max_file_size: Optional[int] = None,
+    trim_air: bool = False,
+    compression: Optional[CompressionPolicy] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
 ) -> List[str]:
-    """Write processed chunks to output files."""
+    """Write processed chunks to output files.
+
+    Args:
+        jobs: Number of worker processes used to encode and compress chunks.
+              1 writes serially in this process.
+        first_index: Number of the first output file, so that successive
+                     calls (e.g. one per streamed band) continue the sequence.
+        stats: If given, records the "encode" and "compress" stages, or
+               "encode_compress" when a process pool or max_file_size
+               does both.
+        max_file_size: If set, bisect any chunk whose estimated or actual
+                       compressed size is over this many bytes (see
+                       split_to_size) before anything is written.
+        trim_air: If True, shrink each chunk to the bounding box of its
+                  non-air blocks and entities (see trim_chunk) and skip
+                  chunks left with nothing. Records the "trim" stage.
+        compression: gzip level and threads per file, or raw NBT output
+                     (see CompressionPolicy). Defaults to gzip level 9.
+                     Serial writes record the "compress" stage with the
+                     NBT size as bytes_in, so levels can be compared.
+        executor: Pool to encode in when jobs > 1, made by chunk_writer_pool
+                  for source_file, so successive calls (e.g. one per
+                  streamed band) share its workers. One is created for
+                  this call if omitted.
+    """
+    stats = stats if stats is not None else StageStats()
+    compression = compression or CompressionPolicy()
     (
         chunk,
         chunk_palette,
@@ -396,60 +1440,131 @@ def write_chunks(
 
     os.makedirs(output_directory, exist_ok=True)
 
-    root = source_file.compound
-    schematic = root["Schematic"]
-    blocks = schematic["Blocks"]
-
-    written_files: List[str] = []
     skipped_air = 0
-    output_index = 0
-
-    file_nums = list(chunk.keys())
+    chunk_jobs: List[Tuple] = []
 
-    for file_num in tqdm(file_nums, desc="  Writing chunks", unit="chunk", leave=True):
+    for file_num in chunk.keys():
         # -a: skip chunks that are entirely air
         if skip_air and chunk_is_all_air(chunk_palette[file_num]):
             skipped_air += 1
             continue
 
-        dims = chunk_dimensions[file_num]
-        w, h, l = dims[0], dims[1], dims[2]
-
-        schematic["Width"] = ShortTag(w)
-        schematic["Height"] = ShortTag(h)
-        schematic["Length"] = ShortTag(l)
-
         # Block entities (omit from schematic if -e is used)
         if export_entities:
-            blocks["BlockEntities"] = ListTag()
-            schematic["Entities"] = ListTag()
+            be_list = e_list = None
         else:
             be_list = chunk_block_entities.get(file_num)
-            blocks["BlockEntities"] = ListTag(be_list) if be_list else ListTag()
-
             e_list = chunk_entities.get(file_num)
-            schematic["Entities"] = ListTag(e_list) if e_list else ListTag()
 
-        # Block data
-        blocks["Data"] = ByteArrayTag(varintWriter.write(chunk[file_num], w, h, l))
-        blocks["Palette"] = CompoundTag(chunk_palette[file_num])
+        chunk_args = (
+            chunk_dimensions[file_num],
+            chunk_offset[file_num],
+            chunk[file_num],
+            chunk_palette[file_num],
+            chunk_biomes[file_num] if has_biomes else None,
+            chunk_biomes_palette[file_num] if has_biomes else None,
+            be_list,
+            e_list,
+        )
+        if trim_air:
+            with stats.stage("trim", blocks=_volume(chunk_args[0])):
+                chunk_args = trim_chunk(*chunk_args)
+            if chunk_args is None:
+                skipped_air += 1
+                continue
+        chunk_jobs.append(chunk_args)
 
-        # Biomes
-        if has_biomes:
-            biomes = schematic["Biomes"]
-            biomes["Data"] = ByteArrayTag(
-                varintWriter.write(chunk_biomes[file_num], w, h, l)
-            )
-            biomes["Palette"] = CompoundTag(chunk_biomes_palette[file_num])
+    progress = tqdm(
+        total=len(chunk_jobs), desc="  Writing chunks", unit="chunk", leave=True
+    )
+    written_files: List[str] = []
 
-        schematic["Offset"] = IntArrayTag(chunk_offset[file_num])
+    def next_location() -> str:
+        return os.path.join(
+            output_directory, f"{output_name}{first_index + len(written_files)}.schem"
+        )
+
+    if jobs > 1 and len(chunk_jobs) > 1:
+        blocks = sum(_volume(job[0]) for job in chunk_jobs)
+        with stats.stage("encode_compress", blocks=blocks) as counters:
+            if executor is not None:
+                pool = nullcontext(executor)
+            else:
+                pool = chunk_writer_pool(source_file, jobs)
+            with pool as executor:
+                packed_jobs = [
+                    (*job[:-2], _pack_tag_list(job[-2]), _pack_tag_list(job[-1]))
+                    for job in chunk_jobs
+                ]
+                if max_file_size is not None:
+                    base_size = chunk_base_size(source_file, compression)
+                    sized_jobs = (
+                        (
+                            max_file_size,
+                            skip_air,
+                            base_size,
+                            compression,
+                            *job,
+                        )
+                        for job in packed_jobs
+                    )
+                    for payloads in executor.map(_encode_sized_chunk, sized_jobs):
+                        for payload in payloads:
+                            written_files.append(
+                                _write_payload(next_location(), payload)
+                            )
+                            counters["bytes_out"] += len(payload)
+                        progress.update(1)
+                else:
+                    locations = [
+                        os.path.join(
+                            output_directory, f"{output_name}{first_index + i}.schem"
+                        )
+                        for i in range(len(packed_jobs))
+                    ]
+                    for output_location in executor.map(
+                        _write_chunk_file,
+                        [
+                            (loc, compression, *job)
+                            for loc, job in zip(locations, packed_jobs)
+                        ],
+                    ):
+                        written_files.append(output_location)
+                        counters["bytes_out"] += os.path.getsize(output_location)
+                        progress.update(1)
+    elif max_file_size is not None:
+        base_size = chunk_base_size(source_file, compression)
+        for chunk_args in chunk_jobs:
+            with stats.stage(
+                "encode_compress", blocks=_volume(chunk_args[0])
+            ) as counters:
+                payloads = split_to_size(
+                    source_file,
+                    max_file_size,
+                    *chunk_args,
+                    skip_air=skip_air,
+                    base_size=base_size,
+                    compression=compression,
+                )
+            for payload in payloads:
+                written_files.append(_write_payload(next_location(), payload))
+                counters["bytes_out"] += len(payload)
+            progress.update(1)
+    else:
+        for chunk_args in chunk_jobs:
+            output_location = next_location()
+            with stats.stage("encode", blocks=_volume(chunk_args[0])):
+                chunk_tag = build_chunk_tag(source_file, *chunk_args)
+            with stats.stage("compress") as counters:
+                data = chunk_tag.save_to(compressed=False)
+                payload = compression.encode(data)
+                _write_payload(output_location, payload)
+                counters["bytes_in"] = len(data)
+                counters["bytes_out"] = len(payload)
+            written_files.append(output_location)
+            progress.update(1)
 
-        output_location = os.path.join(
-            output_directory, f"{output_name}{output_index}.schem"
-        )
-        source_file.save_to(output_location, compressed=True)
-        written_files.append(output_location)
-        output_index += 1
+    progress.close()
 
     if skipped_air > 0:
         print(f"Skipped {skipped_air} air-only chunk(s).")
@@ -466,6 +1581,10 @@ def resplit_oversized(
     skip_air: bool = False,
     ignore_blocks: Optional[Set[str]] = None,
     export_entities: bool = False,
+    jobs: int = 1,
+    stream: bool = False,
+    trim_air: bool = False,
+    compression: Optional[CompressionPolicy] = None,
 ):
     """Re-split any output files that exceed max_file_size (in bytes)."""
     iteration = 0
@@ -504,6 +1623,10 @@ def resplit_oversized(
                     ignore_blocks=ignore_blocks,
                     export_entities=export_entities,
                     max_file_size=None,
+                    jobs=jobs,
+                    stream=stream,
+                    trim_air=trim_air,
+                    compression=compression,
                 )
             except Exception as e:
                 print(f"Warning: could not re-split {filepath}: {e}")
@@ -547,7 +1670,15 @@ def split_schematic(
     ignore_blocks: Optional[Set[str]] = None,
     export_entities: bool = False,
     max_file_size: Optional[int] = None,
-) -> List[str]:
+    jobs: int = 1,
+    stream: bool = False,
+    stats: Optional[StageStats] = None,
+    return_stats: bool = False,
+    in_memory_resplit: bool = False,
+    planner: str = "grid",
+    trim_air: bool = False,
+    compression: Optional[CompressionPolicy] = None,
+):
     """Split a schematic file into smaller chunks based on block limit.
 
     Args:
@@ -561,13 +1692,57 @@ def split_schematic(
                          and strip them from the .schem outputs.
         max_file_size: If set, re-split any output file exceeding this many
                        bytes until all files are under the limit.
+        jobs: Number of worker processes used to write output chunks.
+        stream: If True, decode and write one horizontal band of chunks at a
+                time, so only one chunk layer is ever decoded. The block
+                and biome data are read in place from the decompressed
+                file rather than parsed (see LazySchematic.parse), but that
+                whole file stays in memory.
+        stats: Collector for per-stage timings. A new one is used if omitted.
+        in_memory_resplit: With max_file_size, estimate and check each
+                           chunk's compressed size in memory and bisect
+                           oversized chunks before writing, instead of
+                           re-splitting written files.
+        return_stats: If True, also return the stage statistics.
+        planner: "grid" cuts the volume into equal boxes of at most
+                 block_limit blocks. "adaptive" decodes the volume first
+                 and cuts boxes holding at most block_limit non-air blocks
+                 each (see plan_adaptive_chunks). Not supported with stream.
+        trim_air: If True, trim each chunk to the bounding box of its
+                  non-air blocks and entities, adjusting its Offset, and
+                  skip chunks that hold only air.
+        compression: How every written file is compressed: gzip level 0
+                     (fastest) to 9 (smallest, the default), threads per
+                     file, or raw NBT to be compressed later (see
+                     compress_outputs).
 
     Returns:
-        List of written output file paths.
+        List of written output file paths, or (paths, stats dict) if
+        return_stats is True.
     """
+    stats = stats if stats is not None else StageStats()
+    if planner not in ("grid", "adaptive"):
+        raise ValueError(f"Unknown chunk planner: {planner}")
+    if planner == "adaptive" and stream:
+        raise ValueError("The adaptive planner cannot be combined with streaming.")
+
     print(f"Loading schematic file: {filename}")
     try:
-        source_file = schematicutil.load_schematic(filename)
+        with stats.stage("load") as counters:
+            if stream:
+                # Bands decode straight from the file's buffer, so the
+                # block and biome data are never parsed into tags
+                lazy_file = schematicutil.load_schematic_lazy(filename)
+                source_file = None
+                if lazy_file is not None:
+                    source_file = lazy_file.parse(
+                        ("Schematic", "Blocks", "Data"),
+                        ("Schematic", "Biomes", "Data"),
+                    )
+            else:
+                source_file = schematicutil.load_schematic(filename)
+            if source_file is not None:
+                counters["bytes_in"] = os.path.getsize(filename)
     except Exception as e:
         raise ValueError(f"Failed to load schematic file: {e}")
 
@@ -585,90 +1760,582 @@ def split_schematic(
         f"({total_blocks:,} blocks)"
     )
 
-    # Calculate chunk dimensions
-    max_chunk_dims = calculate_chunk_dimensions(*source_dims, block_limit)
-    chunk_width = ceil(source_dims[0] / max_chunk_dims[0])
-    chunk_height = ceil(source_dims[1] / max_chunk_dims[1])
-    chunk_length = ceil(source_dims[2] / max_chunk_dims[2])
-    num_chunks = chunk_width * chunk_height * chunk_length
-    print(
-        f"Chunk size: {max_chunk_dims[0]}x{max_chunk_dims[1]}x{max_chunk_dims[2]} "
-        f"-> {num_chunks} chunk(s)"
-    )
-
-    # Process entities
-    print("Processing entities...")
+    source_blocks = schematicutil.get_block_data(source_file)
+    source_biomes = schematicutil.get_biome_data(source_file)
     source_entities = schematicutil.get_entities(source_file)
-    chunk_entities = process_entities(
-        source_entities, max_chunk_dims, chunk_width, chunk_length
-    )
+    source_block_entities = source_blocks["BlockEntities"]
 
-    # Process block entities
-    print("Processing block entities...")
-    source_block_entities = schematicutil.get_block_data(source_file)["BlockEntities"]
-    chunk_block_entities = process_block_entities(
-        source_block_entities, max_chunk_dims, chunk_width, chunk_length
-    )
+    if planner == "adaptive":
+        # The plan depends on where the blocks are, so decode first
+        print("Processing block data...")
+        decoded = decode_source(
+            source_blocks, source_biomes, source_dims, ignore_blocks, stats
+        )
+        cell_size = occupancy_cell_size(block_limit)
+        with stats.stage("plan", blocks=total_blocks):
+            occupancy = occupancy_grid(
+                decoded[0], decoded[2], (cell_size, cell_size, cell_size)
+            )
+            boxes, cell_owner = plan_adaptive_chunks(
+                occupancy, cell_size, source_dims, block_limit
+            )
+        solid = np.bincount(
+            cell_owner.reshape(-1), weights=occupancy.reshape(-1), minlength=len(boxes)
+        )
+        print(
+            f"Adaptive plan: {len(boxes)} chunk(s), non-air blocks per chunk "
+            f"min {int(solid.min()):,} / median {int(np.median(solid)):,} / "
+            f"max {int(solid.max()):,}"
+        )
 
-    # Process chunk data
-    print("Processing block data...")
-    source_blocks = schematicutil.get_block_data(source_file)
-    source_biomes = schematicutil.get_biome_data(source_file)
-    chunk_data = process_chunk_data(
-        source_blocks,
-        source_biomes,
-        max_chunk_dims,
-        source_dims,
-        source_offset,
-        chunk_width,
-        chunk_length,
-        ignore_blocks=ignore_blocks,
-    )
+        print("Processing entities...")
+        with stats.stage("entities"):
+            chunk_entities = process_entities_in_boxes(
+                source_entities, boxes, cell_owner, cell_size
+            )
+        print("Processing block entities...")
+        with stats.stage("block_entities"):
+            chunk_block_entities = process_block_entities_in_boxes(
+                source_block_entities, boxes, cell_owner, cell_size
+            )
+    else:
+        # Calculate chunk dimensions
+        max_chunk_dims = calculate_chunk_dimensions(*source_dims, block_limit)
+        chunk_width = ceil(source_dims[0] / max_chunk_dims[0])
+        chunk_height = ceil(source_dims[1] / max_chunk_dims[1])
+        chunk_length = ceil(source_dims[2] / max_chunk_dims[2])
+        num_chunks = chunk_width * chunk_height * chunk_length
+        print(
+            f"Chunk size: {max_chunk_dims[0]}x{max_chunk_dims[1]}x{max_chunk_dims[2]} "
+            f"-> {num_chunks} chunk(s)"
+        )
+        boxes = list(iter_chunk_boxes(source_dims, max_chunk_dims))
+
+        # Process entities
+        print("Processing entities...")
+        with stats.stage("entities"):
+            chunk_entities = process_entities(
+                source_entities, max_chunk_dims, chunk_width, chunk_length
+            )
+
+        # Process block entities
+        print("Processing block entities...")
+        with stats.stage("block_entities"):
+            chunk_block_entities = process_block_entities(
+                source_block_entities, max_chunk_dims, chunk_width, chunk_length
+            )
+
+    # Chunks are sized in memory while writing; otherwise oversized files
+    # are re-split after the fact
+    size_cap = None
+    if in_memory_resplit and max_file_size is not None and max_file_size > 0:
+        size_cap = max_file_size
+        max_file_size = None
 
     # Export entities to separate file if requested
     if export_entities:
         print("Exporting entities to separate schematics...")
-        _, _, chunk_offset, chunk_dimensions_data, *_ = chunk_data
-        export_entities_file(
+        chunk_offset, chunk_dimensions_data = box_layout(boxes, source_offset)
+        with stats.stage("export_entities") as counters:
+            entity_files = export_entities_file(
+                source_file,
+                chunk_entities,
+                chunk_block_entities,
+                chunk_offset,
+                chunk_dimensions_data,
+                output_directory,
+                output_name,
+                compression,
+            )
+            counters["bytes_out"] = sum(os.path.getsize(f) for f in entity_files)
+
+    if stream:
+        # Decode and write one band of chunks at a time
+        print("Streaming block data to output files...")
+        written_files: List[str] = []
+        bands = iter_chunk_bands(
+            schematicutil.get_block_data(lazy_file),
+            schematicutil.get_biome_data(lazy_file),
+            max_chunk_dims,
+            source_dims,
+            source_offset,
+            ignore_blocks=ignore_blocks,
+            stats=stats,
+            skip_air=skip_air,
+        )
+        # One pool for every band, so workers and the template are set up once
+        pool = nullcontext()
+        if jobs > 1:
+            pool = chunk_writer_pool(source_file, jobs)
+        with pool as executor:
+            for band_data in tqdm(
+                bands, total=chunk_height, desc="  Bands", unit="band", leave=True
+            ):
+                written_files += write_chunks(
+                    source_file,
+                    band_data,
+                    chunk_entities,
+                    chunk_block_entities,
+                    output_directory,
+                    output_name,
+                    skip_air=skip_air,
+                    export_entities=export_entities,
+                    jobs=jobs,
+                    first_index=len(written_files),
+                    stats=stats,
+                    max_file_size=size_cap,
+                    trim_air=trim_air,
+                    compression=compression,
+                    executor=executor,
+                )
+    else:
+        # Process chunk data
+        if planner == "adaptive":
+            empty = None
+            if skip_air:
+                empty = {number for number, _, _ in boxes if not solid[number]}
+            chunk_data = chunk_boxes(decoded, boxes, source_offset, stats, empty)
+            del decoded
+        else:
+            print("Processing block data...")
+            chunk_data = process_chunk_data(
+                source_blocks,
+                source_biomes,
+                max_chunk_dims,
+                source_dims,
+                source_offset,
+                chunk_width,
+                chunk_length,
+                ignore_blocks=ignore_blocks,
+                stats=stats,
+                skip_air=skip_air,
+            )
+
+        # Write chunks to files
+        print("Writing chunks to output files...")
+        written_files = write_chunks(
             source_file,
+            chunk_data,
             chunk_entities,
             chunk_block_entities,
-            chunk_offset,
-            chunk_dimensions_data,
             output_directory,
             output_name,
+            skip_air=skip_air,
+            export_entities=export_entities,
+            jobs=jobs,
+            stats=stats,
+            max_file_size=size_cap,
+            trim_air=trim_air,
+            compression=compression,
         )
 
-    # Write chunks to files
-    print("Writing chunks to output files...")
-    written_files = write_chunks(
-        source_file,
-        chunk_data,
-        chunk_entities,
-        chunk_block_entities,
-        output_directory,
-        output_name,
-        skip_air=skip_air,
-        export_entities=export_entities,
-    )
-
     # Re-split any chunks that exceed the file-size limit
     if max_file_size is not None and max_file_size > 0:
-        resplit_oversized(
-            written_files,
-            max_file_size,
-            output_directory,
-            output_name,
-            block_limit,
-            skip_air=skip_air,
-            ignore_blocks=ignore_blocks,
-            export_entities=export_entities,
-        )
+        with stats.stage("resplit"):
+            resplit_oversized(
+                written_files,
+                max_file_size,
+                output_directory,
+                output_name,
+                block_limit,
+                skip_air=skip_air,
+                ignore_blocks=ignore_blocks,
+                export_entities=export_entities,
+                jobs=jobs,
+                stream=stream,
+                trim_air=trim_air,
+                compression=compression,
+            )
 
-    print(f"Done -- wrote {len(written_files)} chunk file(s).")
+    print(
+        f"Done -- wrote {len(written_files)} chunk file(s) "
+        f"({(compression or CompressionPolicy()).describe()})."
+    )
+    if return_stats:
+        return written_files, stats.to_dict()
     return written_files
 
 
+def _compress_file_job(job: Tuple[str, int, int]) -> bool:
+    return parallelGzip.compress_file(*job)
+
+
+def compress_outputs(
+    paths: List[str],
+    compression: Optional[CompressionPolicy] = None,
+    jobs: int = 1,
+    stats: Optional[StageStats] = None,
+) -> int:
+    """Gzip, in place, the raw NBT files written by an uncompressed run.
+
+    Files that are already gzipped are left alone, so a directory can be
+    compressed again after more raw files were added to it.
+
+    Args:
+        compression: Level and threads per file; its compressed flag is
+                     ignored.
+        jobs: Number of worker processes, each compressing whole files.
+        stats: If given, records the "compress_outputs" stage.
+
+    Returns:
+        Number of files compressed.
+    """
+    stats = stats if stats is not None else StageStats()
+    compression = compression or CompressionPolicy()
+    file_jobs = [(path, compression.level, compression.threads) for path in paths]
+    progress = tqdm(total=len(file_jobs), desc="  Compressing", unit="file")
+    compressed = 0
+    with stats.stage("compress_outputs") as counters:
+        counters["bytes_in"] = sum(os.path.getsize(path) for path in paths)
+        if jobs > 1 and len(file_jobs) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for done in executor.map(_compress_file_job, file_jobs):
+                    compressed += done
+                    progress.update(1)
+        else:
+            for job in file_jobs:
+                compressed += _compress_file_job(job)
+                progress.update(1)
+        counters["bytes_out"] = sum(os.path.getsize(path) for path in paths)
+    progress.close()
+    return compressed
+
+
+# ---------------------------------------------------------------------------
+# World export
+# ---------------------------------------------------------------------------
+
+
+def export_to_world(
+    filename: str,
+    world_directory: str,
+    origin: Tuple[int, int, int],
+    skip_air: bool = False,
+    ignore_blocks: Optional[Set[str]] = None,
+    include_block_entities: bool = True,
+    stats: Optional[StageStats] = None,
+    jobs: int = 1,
+) -> List[str]:
+    """Write a schematic's blocks straight into a world's region files.
+
+    The schematic's minimum corner is placed at origin. Blocks are grouped
+    by region file, then chunk, then 16-block section, and each region file
+    is read, patched and rewritten once. Chunks missing from the world are
+    created empty. Every patched chunk, new or existing, is marked unlit
+    and has its heightmaps removed, so the game relights it and rebuilds
+    them on load. Entities are not exported.
+
+    Args:
+        world_directory: World folder (its region/ subfolder is used, and
+                         created if the folder holds level.dat) or a
+                         folder that already holds .mca files.
+        origin: World coordinates of the schematic's minimum corner.
+        skip_air: If True, keep the world's blocks where the schematic has air.
+        ignore_blocks: Set of base block names to treat as air.
+        include_block_entities: If True, copy block entities (chest
+                                contents, sign text...) into the chunks.
+        stats: If given, records the "load", "decode", "world_group" and
+               "world_patch" stages, and the time taken by each region file
+               as "region r.X.Z.mca".
+        jobs: Number of worker processes patching region files. Regions
+              are independent, so each is read, patched and written by
+              one worker, largest first, and collected as they finish.
+
+    Returns:
+        Paths of the region files written.
+    """
+    stats = stats if stats is not None else StageStats()
+    region_directory = world_region_directory(world_directory)
+
+    print(f"Loading schematic file: {filename}")
+    try:
+        # Entities are never needed here and block entities only on request,
+        # so the file is indexed rather than parsed
+        with stats.stage("load") as counters:
+            source_file = schematicutil.load_schematic_lazy(filename)
+            if source_file is not None:
+                counters["bytes_in"] = os.path.getsize(filename)
+    except Exception as e:
+        raise ValueError(f"Failed to load schematic file: {e}")
+    if source_file is None:
+        raise ValueError("Invalid file extension. Please provide a .schem file.")
+
+    source_dims = schematicutil.get_dimension(source_file)
+    source_blocks = schematicutil.get_block_data(source_file)
+    schematic = source_file.compound["Schematic"]
+    data_version = int(schematic["DataVersion"]) if "DataVersion" in schematic else 3700
+    ox, oy, oz = origin
+    if oy < -64 or oy + source_dims[1] > 320:
+        print(
+            f"Warning: Y {oy} to {oy + source_dims[1] - 1} extends past the "
+            f"-64 to 319 build range."
+        )
+
+    print("Processing block data...")
+    block_volume, _, (lut, names), _ = decode_source(
+        source_blocks, None, source_dims, ignore_blocks, stats
+    )
+    states = [normalize_block_state(name) for name in names]
+    is_air = np.array([is_air_block(name) for name in names] + [False])
+
+    print("Grouping blocks by region, chunk and section...")
+    with stats.stage("world_group", blocks=block_volume.size):
+        region_edits = _group_world_edits(
+            block_volume, lut, states, is_air, origin, skip_air
+        )
+        region_block_entities: Dict = {}
+        if include_block_entities:
+            region_block_entities = _group_world_block_entities(
+                source_blocks["BlockEntities"], block_volume, lut, is_air, origin
+            )
+
+    written_files: List[str] = []
+    patched = created = 0
+    # Largest regions first, so a big one does not start last and hold up
+    # the end of the run
+    region_jobs = sorted(
+        (
+            (
+                worldUtil.region_path(region_directory, rx, rz),
+                chunk_edits,
+                data_version,
+                _pack_chunk_block_entities(region_block_entities.get((rx, rz))),
+            )
+            for (rx, rz), chunk_edits in region_edits.items()
+        ),
+        key=lambda job: -_edit_count(job[1]),
+    )
+    progress = tqdm(total=len(region_jobs), desc="  Regions", unit="region", leave=True)
+    with stats.stage("world_patch") as counters:
+        if jobs > 1 and len(region_jobs) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [
+                    executor.submit(_patch_region_job, job) for job in region_jobs
+                ]
+                results = (future.result() for future in as_completed(futures))
+                for path, counts, wall, cpu, blocks in results:
+                    patched += counts[0]
+                    created += counts[1]
+                    stats.add(
+                        f"region {os.path.basename(path)}",
+                        wall,
+                        cpu,
+                        blocks=blocks,
+                        bytes_out=os.path.getsize(path),
+                    )
+                    written_files.append(path)
+                    progress.update(1)
+        else:
+            for job in region_jobs:
+                path, counts, wall, cpu, blocks = _patch_region_job(job)
+                patched += counts[0]
+                created += counts[1]
+                stats.add(
+                    f"region {os.path.basename(path)}",
+                    wall,
+                    cpu,
+                    blocks=blocks,
+                    bytes_out=os.path.getsize(path),
+                )
+                written_files.append(path)
+                progress.update(1)
+        counters["bytes_out"] = sum(os.path.getsize(path) for path in written_files)
+    progress.close()
+
+    if len(written_files) > 1:
+        region_times = [
+            (stats.stages[f"region {os.path.basename(path)}"]["wall_seconds"], path)
+            for path in written_files
+        ]
+        slowest, slowest_path = max(region_times)
+        print(
+            f"Slowest region: {os.path.basename(slowest_path)} ({slowest:.2f}s); "
+            f"total across regions {sum(t for t, _ in region_times):.2f}s."
+        )
+    print(
+        f"Done -- patched {patched} chunk(s) ({created} new) in "
+        f"{len(written_files)} region file(s)."
+    )
+    return sorted(written_files)
+
+
+def world_region_directory(world_directory: str) -> str:
+    """Return the folder whose region files export_to_world should patch.
+
+    Raises:
+        ValueError: If world_directory is neither a world (with a region/
+                    subfolder or a level.dat) nor a folder of .mca files,
+                    since region files written anywhere else would never
+                    be read by the game.
+    """
+    region_directory = os.path.join(world_directory, "region")
+    if os.path.isdir(region_directory):
+        return region_directory
+    if os.path.isfile(os.path.join(world_directory, "level.dat")):
+        os.makedirs(region_directory, exist_ok=True)
+        return region_directory
+    if os.path.isdir(world_directory) and any(
+        name.endswith(".mca") for name in os.listdir(world_directory)
+    ):
+        return world_directory
+    raise ValueError(
+        f"{world_directory} is not a world folder (no region/ or level.dat) "
+        "and holds no .mca files."
+    )
+
+
+def _edit_count(chunk_edits: Dict) -> int:
+    """Number of block positions in a region's edits."""
+    return sum(
+        len(positions)
+        for sections in chunk_edits.values()
+        for section in sections.values()
+        for positions in section.values()
+    )
+
+
+def _pack_chunk_block_entities(
+    chunk_block_entities: Optional[Dict],
+) -> Optional[Dict]:
+    if not chunk_block_entities:
+        return None
+    return {key: _pack_tag_list(items) for key, items in chunk_block_entities.items()}
+
+
+def _patch_region_job(job: Tuple) -> Tuple[str, Tuple[int, int], float, float, int]:
+    """Worker entry point: patch one region file and time it.
+
+    Returns:
+        (path, (chunks patched, chunks created), wall seconds, CPU seconds,
+         blocks written)
+    """
+    path, chunk_edits, data_version, packed_block_entities = job
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    chunk_block_entities = None
+    if packed_block_entities:
+        chunk_block_entities = {
+            key: _unpack_tag_list(data) for key, data in packed_block_entities.items()
+        }
+    counts = worldUtil.patch_region(
+        path, chunk_edits, data_version, chunk_block_entities
+    )
+    return (
+        path,
+        counts,
+        time.perf_counter() - wall_start,
+        time.process_time() - cpu_start,
+        _edit_count(chunk_edits),
+    )
+
+
+def _section_spans(start: int, extent: int) -> Iterator[Tuple[int, int]]:
+    """Split [0, extent) into runs that each fall in one section after adding start."""
+    low = 0
+    while low < extent:
+        high = min(extent, low + 16 - ((start + low) & 15))
+        yield low, high
+        low = high
+
+
+def _group_world_edits(
+    block_volume: np.ndarray,
+    lut: np.ndarray,
+    states: List[str],
+    is_air: np.ndarray,
+    origin: Tuple[int, int, int],
+    skip_air: bool,
+) -> Dict:
+    """Group the blocks to write by region, chunk and section.
+
+    Returns:
+        {(rx, rz): {(cx, cz): {section_y: {block_state: offsets}}}} in the
+        form worldUtil.patch_region takes, where offsets is an array of
+        section offsets (ly << 8 | lz << 4 | lx).
+    """
+    height, length, width = block_volume.shape
+    ox, oy, oz = origin
+    edits: Dict = {}
+    for y0, y1 in _section_spans(oy, height):
+        section_y = (oy + y0) >> 4
+        for z0, z1 in _section_spans(oz, length):
+            cz = (oz + z0) >> 4
+            for x0, x1 in _section_spans(ox, width):
+                cx = (ox + x0) >> 4
+                ids = _lookup(lut, block_volume[y0:y1, z0:z1, x0:x1])
+                present = np.unique(ids)
+                if present[-1] >= len(states):
+                    raise ValueError(MISSING_PALETTE_ID)
+                if skip_air:
+                    present = present[~is_air[present]]
+                if not present.size:
+                    continue
+
+                # Section offsets of the span, grouped by state with one sort
+                ys, zs, xs = np.indices(ids.shape, dtype=np.int16).reshape(3, -1)
+                offsets = (
+                    (((ys + ((oy + y0) & 15)) & 15) << 8)
+                    | (((zs + ((oz + z0) & 15)) & 15) << 4)
+                    | ((xs + ((ox + x0) & 15)) & 15)
+                )
+                flat = ids.reshape(-1)
+                order = np.argsort(flat, kind="stable")
+                ordered = flat[order]
+                starts = np.searchsorted(ordered, present).tolist()
+                ends = np.searchsorted(ordered, present, side="right").tolist()
+                section = {
+                    states[number]: offsets[order[start:end]]
+                    for number, start, end in zip(present.tolist(), starts, ends)
+                }
+                region = edits.setdefault((cx >> 5, cz >> 5), {})
+                region.setdefault((cx, cz), {})[section_y] = section
+    return edits
+
+
+def _group_world_block_entities(
+    source_block_entities: ListTag,
+    block_volume: np.ndarray,
+    lut: np.ndarray,
+    is_air: np.ndarray,
+    origin: Tuple[int, int, int],
+) -> Dict:
+    """Convert Sponge block entities to chunk format, grouped by region and chunk.
+
+    Block entities on air (e.g. of ignored blocks) are dropped.
+
+    Returns:
+        {(rx, rz): {(cx, cz): [block entity compound, ...]}}
+    """
+    height, length, width = block_volume.shape
+    ox, oy, oz = origin
+    grouped: Dict = {}
+    for item in source_block_entities:
+        x, y, z = (int(v) for v in item["Pos"])
+        if not (0 <= x < width and 0 <= y < height and 0 <= z < length):
+            continue
+        if is_air[lut[block_volume[y, z, x]]]:
+            continue
+
+        # Sponge v3 nests the fields under Data; v2 keeps them alongside Id
+        if "Data" in item:
+            block_entity = CompoundTag(item["Data"])
+        else:
+            block_entity = CompoundTag(
+                {k: v for k, v in item.items() if k not in ("Id", "Pos")}
+            )
+        wx, wy, wz = x + ox, y + oy, z + oz
+        block_entity["id"] = StringTag(str(item["Id"]))
+        block_entity["x"] = IntTag(wx)
+        block_entity["y"] = IntTag(wy)
+        block_entity["z"] = IntTag(wz)
+        block_entity["keepPacked"] = ByteTag(0)
+
+        cx, cz = wx >> 4, wz >> 4
+        region = grouped.setdefault((cx >> 5, cz >> 5), {})
+        region.setdefault((cx, cz), []).append(block_entity)
+    return grouped
+
+
 # ---------------------------------------------------------------------------
 # CLI
 # ---------------------------------------------------------------------------
@@ -699,7 +2366,12 @@ def main():
         description="Split a schematic file into smaller chunks."
     )
     parser.add_argument(
-        "source_file", type=str, help="Path to the .schem file to split."
+        "source_file",
+        type=str,
+        help=(
+            "Path to the .schem file to split (with --compress-existing, a "
+            ".schem file or a directory of them)."
+        ),
     )
     parser.add_argument(
         "--output_directory",
@@ -761,7 +2433,181 @@ def main():
         ),
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help=(
+            "Number of worker processes used to encode and compress output "
+            "chunks. Output is identical to the default serial mode."
+        ),
+    )
+
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        choices=range(10),
+        default=parallelGzip.DEFAULT_LEVEL,
+        metavar="0-9",
+        help=(
+            "gzip level of the written .schem files: 1 is several times faster "
+            "than 9 for somewhat larger files, 0 stores them uncompressed "
+            "inside gzip (default: 9)."
+        ),
+    )
+    parser.add_argument(
+        "--compress-threads",
+        type=int,
+        default=1,
+        metavar="N",
+        help=(
+            "Compress each file as independent blocks in N threads, pigz "
+            "style. The files are still standard gzip (default: 1)."
+        ),
+    )
+
+    parser.add_argument(
+        "--uncompressed",
+        action="store_true",
+        default=False,
+        help=(
+            "Write raw NBT .schem files without gzip, for a later processing "
+            "step; compress them afterwards with --compress-existing. The "
+            "splitter reads either form."
+        ),
+    )
+    parser.add_argument(
+        "--compress-existing",
+        action="store_true",
+        default=False,
+        help=(
+            "Instead of splitting, gzip the uncompressed .schem files at "
+            "source_file (a file or directory) in place, using "
+            "--compression-level, --compress-threads and -j."
+        ),
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=False,
+        help=(
+            "Decode and write one horizontal layer of chunks at a time, so "
+            "decoded block and biome data never exceed one chunk layer. The "
+            "whole decompressed file is still held in memory (and, while it "
+            "is decompressed, the compressed file too), so this does not "
+            "help with files larger than RAM."
+        ),
+    )
+
+    parser.add_argument(
+        "--stats-json",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help=(
+            "Write per-stage wall time, CPU time, byte and block counts to FILE "
+            "as JSON."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="chunk",
+        default=None,
+        choices=PROFILE_STAGES,
+        metavar="STAGE",
+        help=(
+            "Print a per-stage timing table and run cProfile around STAGE "
+            f"({', '.join(PROFILE_STAGES)}; default: "
+            "chunk). --world runs also list a 'region r.X.Z.mca' row per "
+            "region file, timed where it was patched; profile world_patch "
+            "with -j 1 to see inside them."
+        ),
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Dump the raw cProfile data to FILE instead of printing it.",
+    )
+
+    parser.add_argument(
+        "--in-memory-resplit",
+        action="store_true",
+        default=False,
+        help=(
+            "With -s, bisect chunks whose estimated or in-memory compressed "
+            "size is over the limit along their longest axis before writing, "
+            "instead of writing, "
+            "reloading and re-splitting them. Output stays numbered Out0, "
+            "Out1, ... with no gaps."
+        ),
+    )
+    parser.add_argument(
+        "--planner",
+        choices=("grid", "adaptive"),
+        default="grid",
+        help=(
+            "How to choose chunk boxes. 'grid' (default) uses equal boxes of at "
+            "most --block_limit blocks. 'adaptive' decodes the schematic first "
+            "and splits it k-d tree style into boxes of at most --block_limit "
+            "non-air blocks, so sparse areas need fewer files. Cannot be "
+            "combined with --stream."
+        ),
+    )
+
+    parser.add_argument(
+        "--trim-air",
+        action="store_true",
+        default=False,
+        help=(
+            "Trim each chunk to the bounding box of its non-air blocks and "
+            "entities, moving its Offset to match, so files carry no air "
+            "padding. Chunks that hold only air are skipped, as with -a."
+        ),
+    )
+
+    parser.add_argument(
+        "--world",
+        type=str,
+        default=None,
+        metavar="DIR",
+        help=(
+            "Write the blocks straight into this world's region files (or a "
+            "folder that already holds .mca files) instead of producing .schem "
+            "chunks. A missing region/ is only created next to level.dat. "
+            "Requires --origin. -a keeps the world's blocks where the "
+            "schematic has air; -i applies as usual. Entities are not exported."
+        ),
+    )
+    parser.add_argument(
+        "--origin",
+        type=int,
+        nargs=3,
+        default=None,
+        metavar=("X", "Y", "Z"),
+        help="With --world, world coordinates of the schematic's minimum corner.",
+    )
+    parser.add_argument(
+        "--no-block-entities",
+        action="store_true",
+        default=False,
+        help="With --world, do not copy block entities into the world.",
+    )
+
     args = parser.parse_args()
+    if args.world and args.origin is None:
+        parser.error("--world requires --origin X Y Z")
+    if args.planner == "adaptive" and args.stream:
+        parser.error("--planner adaptive cannot be combined with --stream")
+    if args.uncompressed and args.max_file_size:
+        parser.error(
+            "-s limits compressed sizes and cannot be used with --uncompressed"
+        )
 
     # Normalise ignore-blocks list into a set of full block names
     ignore_set: Optional[Set[str]] = None
@@ -774,20 +2620,70 @@ def main():
         max_file_size = parse_size(args.max_file_size)
         print(f"Max output file size: {max_file_size:,} bytes")
 
+    stats = StageStats(profile_stage=args.profile, profile_output=args.profile_output)
+    compression = CompressionPolicy(
+        args.compression_level, max(1, args.compress_threads), not args.uncompressed
+    )
+
     try:
-        split_schematic(
-            filename=args.source_file,
-            output_directory=args.output_directory,
-            output_name=args.output_file,
-            block_limit=args.block_limit,
-            skip_air=args.skip_air,
-            ignore_blocks=ignore_set,
-            export_entities=args.export_entities,
-            max_file_size=max_file_size,
-        )
+        if args.compress_existing:
+            paths = [args.source_file]
+            if os.path.isdir(args.source_file):
+                paths = [
+                    os.path.join(args.source_file, name)
+                    for name in sorted(os.listdir(args.source_file))
+                    if name.endswith(".schem")
+                ]
+            count = compress_outputs(paths, compression, max(1, args.jobs), stats)
+            print(
+                f"Done -- compressed {count} of {len(paths)} file(s) "
+                f"({compression.describe()})."
+            )
+        elif args.world:
+            export_to_world(
+                args.source_file,
+                args.world,
+                tuple(args.origin),
+                skip_air=args.skip_air,
+                ignore_blocks=ignore_set,
+                include_block_entities=not args.no_block_entities,
+                stats=stats,
+                jobs=max(1, args.jobs),
+            )
+        else:
+            split_schematic(
+                filename=args.source_file,
+                output_directory=args.output_directory,
+                output_name=args.output_file,
+                block_limit=args.block_limit,
+                skip_air=args.skip_air,
+                ignore_blocks=ignore_set,
+                export_entities=args.export_entities,
+                max_file_size=max_file_size,
+                jobs=max(1, args.jobs),
+                stream=args.stream,
+                stats=stats,
+                in_memory_resplit=args.in_memory_resplit,
+                planner=args.planner,
+                trim_air=args.trim_air,
+                compression=compression,
+            )
     except Exception as e:
         print(f"Error: {e}")
+        return
+
+    if args.profile:
+        print(stats.format_table())
+        report = stats.profile_report()
+        if report:
+            print(report)
+    if args.stats_json:
+        stats.write_json(args.stats_json)
+        print(f"Wrote stage statistics to {args.stats_json}")
 
 
 if __name__ == "__main__":
+    # In the frozen (PyInstaller) build, worker processes run the bundled
+    # executable; this hands them to multiprocessing instead of main()
+    multiprocessing.freeze_support()
     main()
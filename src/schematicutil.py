@@ -1,12 +1,26 @@
+import gzip
+import struct
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
 import amulet_nbt
+import numpy as np
 from amulet_nbt import CompoundTag, ListTag, IntArrayTag
-from typing import Tuple, Optional, Dict
+
+from parallelGzip import GZIP_MAGIC
+
+# Payload sizes of the fixed-size tag types, and element sizes of the arrays
+_FIXED_SIZES = {1: 1, 2: 2, 3: 4, 4: 8, 5: 4, 6: 8}
+_ARRAY_SIZES = {7: 1, 11: 4, 12: 8}
 
 
 def load_schematic(filename: str) -> Optional[amulet_nbt.NamedTag]:
     """
     Load a schematic file and return its NBT data structure.
 
+    Both gzipped files and the raw NBT written by uncompressed runs are
+    read; the gzip magic number tells them apart.
+
     Args:
         filename: Path to the .schem file
 
@@ -16,7 +30,9 @@ def load_schematic(filename: str) -> Optional[amulet_nbt.NamedTag]:
     if not filename.endswith(".schem"):
         return None
 
-    named_tag = amulet_nbt.load(filename, compressed=True)
+    with open(filename, "rb") as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    named_tag = amulet_nbt.load(filename, compressed=compressed)
 
     if "Schematic" not in named_tag.compound:
         raise ValueError("The provided file does not contain a 'Schematic' root tag.")
@@ -24,6 +40,195 @@ def load_schematic(filename: str) -> Optional[amulet_nbt.NamedTag]:
     return named_tag
 
 
+class LazyCompound(Mapping):
+    """
+    A compound tag read from an uncompressed NBT buffer on demand.
+
+    Entries are scanned in file order only as far as the last one asked for,
+    recording where each starts. Values are parsed when first accessed:
+    byte arrays (e.g. Blocks.Data) become read-only int8 NumPy views of the
+    buffer, compounds become LazyCompounds, and everything else is parsed by
+    amulet_nbt from its exact byte range. Lists of compounds or lists are
+    measured by walking their elements, so nothing past them is copied.
+    """
+
+    def __init__(self, buffer: memoryview, start: int):
+        self._buffer = buffer
+        self._next = start
+        # name -> (tag id, offset of the entry, offset of its payload, its end)
+        self._entries: Dict[str, Tuple[int, int, int, Optional[int]]] = {}
+        self._values: Dict[str, Any] = {}
+        # A nested compound is only scanned to its end to step past it
+        self._open: Optional["LazyCompound"] = None
+        self.end: Optional[int] = None
+
+    def _scan(self, name: Optional[str] = None) -> bool:
+        """Read entries until name is found (or, with no name, to the end)."""
+        buffer = self._buffer
+        while self.end is None:
+            if name is not None and name in self._entries:
+                return True
+            if self._open is not None:
+                self._open._scan()
+                self._next, self._open = self._open.end, None
+            entry = self._next
+            tag_id = buffer[entry]
+            if tag_id == 0:
+                self.end = entry + 1
+                break
+            (name_length,) = struct.unpack_from(">H", buffer, entry + 1)
+            key = bytes(buffer[entry + 3 : entry + 3 + name_length]).decode("utf-8")
+            payload = entry + 3 + name_length
+            if tag_id == 10:
+                self._entries[key] = (tag_id, entry, payload, None)
+                self._open = self._values[key] = LazyCompound(buffer, payload)
+                continue
+            self._next = self._skip(tag_id, payload, entry)
+            self._entries[key] = (tag_id, entry, payload, self._next)
+        return name is not None and name in self._entries
+
+    def _skip(self, tag_id: int, offset: int, entry: int) -> int:
+        """Return the end of a payload, stepping over it without parsing."""
+        buffer = self._buffer
+        if tag_id in _FIXED_SIZES:
+            return offset + _FIXED_SIZES[tag_id]
+        if tag_id in _ARRAY_SIZES:
+            (count,) = struct.unpack_from(">i", buffer, offset)
+            return offset + 4 + count * _ARRAY_SIZES[tag_id]
+        if tag_id == 8:
+            (length,) = struct.unpack_from(">H", buffer, offset)
+            return offset + 2 + length
+        if tag_id == 9:
+            element_id = buffer[offset]
+            (count,) = struct.unpack_from(">i", buffer, offset + 1)
+            offset += 5
+            if count <= 0:
+                return offset
+            if element_id in _FIXED_SIZES:
+                return offset + count * _FIXED_SIZES[element_id]
+            for _ in range(count):
+                offset = self._skip(element_id, offset, entry)
+            return offset
+        if tag_id == 10:
+            while True:
+                element_id = buffer[offset]
+                if element_id == 0:
+                    return offset + 1
+                (name_length,) = struct.unpack_from(">H", buffer, offset + 1)
+                offset = self._skip(element_id, offset + 3 + name_length, entry)
+        raise ValueError(f"Unknown NBT tag type {tag_id} at byte {entry}.")
+
+    def __getitem__(self, name: str) -> Any:
+        if name in self._values:
+            return self._values[name]
+        if not self._scan(name):
+            raise KeyError(name)
+        if name in self._values:
+            return self._values[name]
+
+        tag_id, entry, payload, end = self._entries[name]
+        if tag_id == 7:
+            (count,) = struct.unpack_from(">i", self._buffer, payload)
+            value = np.frombuffer(
+                self._buffer, dtype=np.int8, count=count, offset=payload + 4
+            )
+        else:
+            value = amulet_nbt.load(self._buffer[entry:end], compressed=False).tag
+        self._values[name] = value
+        return value
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self._scan(name)
+
+    def __iter__(self) -> Iterator[str]:
+        self._scan()
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        self._scan()
+        return len(self._entries)
+
+
+class LazySchematic:
+    """
+    A schematic file decompressed into memory but parsed on demand.
+
+    ``compound`` is a LazyCompound, so the get_* helpers below work on it
+    as on a NamedTag. Runs that only need the block palette, data and
+    dimensions never parse entities or block entities. parse() gives the
+    rest of the file as a NamedTag for runs that must also write it back
+    out, leaving the bulk arrays to be read through the views.
+    """
+
+    def __init__(self, data: bytes):
+        self.buffer = memoryview(data)
+        if self.buffer[0] != 10:
+            raise ValueError("The provided file does not start with a compound tag.")
+        (name_length,) = struct.unpack_from(">H", self.buffer, 1)
+        self.name = bytes(self.buffer[3 : 3 + name_length]).decode("utf-8")
+        self.compound = LazyCompound(self.buffer, 3 + name_length)
+
+    def parse(self, *arrays: Tuple[str, ...]) -> amulet_nbt.NamedTag:
+        """
+        Parse the whole file except the given byte arrays, which are left
+        empty.
+
+        Args:
+            arrays: Paths of byte array tags below the root compound, e.g.
+                    ("Schematic", "Blocks", "Data"). Paths that are missing
+                    or name another tag type are parsed as usual.
+
+        Returns:
+            NamedTag as from load_schematic, with its fields in file order
+        """
+        cuts = []
+        for path in arrays:
+            compound = self.compound
+            for name in path[:-1]:
+                if not isinstance(compound, LazyCompound) or name not in compound:
+                    break
+                compound = compound[name]
+            else:
+                if isinstance(compound, LazyCompound) and path[-1] in compound:
+                    tag_id, _, payload, end = compound._entries[path[-1]]
+                    if tag_id == 7:
+                        cuts.append((payload, end))
+
+        pieces = []
+        position = 0
+        for payload, end in sorted(cuts):
+            pieces += [self.buffer[position:payload], bytes(4)]
+            position = end
+        pieces.append(self.buffer[position:])
+        return amulet_nbt.load(b"".join(pieces), compressed=False)
+
+
+def load_schematic_lazy(filename: str) -> Optional[LazySchematic]:
+    """
+    Decompress a schematic file (if gzipped) and index it without parsing
+    its tags.
+
+    Args:
+        filename: Path to the .schem file
+
+    Returns:
+        LazySchematic or None if file extension is incorrect
+    """
+    if not filename.endswith(".schem"):
+        return None
+
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    lazy = LazySchematic(data)
+
+    if "Schematic" not in lazy.compound:
+        raise ValueError("The provided file does not contain a 'Schematic' root tag.")
+
+    return lazy
+
+
 def get_block_data(file: amulet_nbt.NamedTag) -> CompoundTag:
     return file.compound["Schematic"]["Blocks"]
 
@@ -0,0 +1,136 @@
+"""Estimate the gzipped size of an output chunk without compressing it.
+
+The estimate is a linear model over cheap statistics of the chunk:
+
+* the NBT size of its block and biome palettes,
+* the run count and entropy of its block index array (gzip pays for each
+  run, more when the palette is varied and runs are long),
+* the run count of its biome index array,
+* the VarInt byte count of its Data arrays,
+* the uncompressed NBT size of its entities and block entities,
+
+added to the compressed size of an empty chunk from the same source, which
+covers metadata and other per-file overhead. The coefficients were fitted
+to every chunk of the tests/*.schem fixtures at several block limits
+(``python benchmark.py --calibrate-size-model``); on those the median error
+is a few percent. Entity NBT compresses least predictably, so callers must
+still check the real size before relying on an estimate.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FEATURES = (
+    "constant",
+    "palette_bytes",
+    "block_run_bits",
+    "biome_runs",
+    "varint_bytes",
+    "entity_bytes",
+)
+
+# Bytes per unit of each feature, in FEATURES order
+COEFFICIENTS = (27.5723, 0.27140, 0.15541, 0.15316, 0.0016540, 0.057762)
+
+
+def index_statistics(indices) -> Tuple[int, int, float, int]:
+    """Summarize an index array as it will be VarInt-encoded.
+
+    Returns:
+        (count, runs, entropy in bits per index, VarInt byte count)
+    """
+    indices = np.asarray(indices)
+    count = indices.size
+    if count == 0:
+        return 0, 0, 0.0, 0
+    if not any(indices.strides):
+        # Broadcast (constant) arrays: avoid materializing them
+        value = int(indices.flat[0])
+        width = 1
+        while value >= 128:
+            value >>= 7
+            width += 1
+        return count, 1, 0.0, count * width
+
+    flat = indices.reshape(-1)
+    runs = int(np.count_nonzero(flat[1:] != flat[:-1])) + 1
+    frequencies = np.bincount(flat)
+    p = frequencies[frequencies > 0] / count
+    entropy = float(-(p * np.log2(p)).sum())
+    varint_bytes = count
+    for shift in (7, 14, 21, 28):
+        extra = int(np.count_nonzero(flat >= (1 << shift)))
+        if not extra:
+            break
+        varint_bytes += extra
+    return count, runs, entropy, varint_bytes
+
+
+def palette_bytes(palette: Optional[Sequence[str]]) -> int:
+    """NBT size of a palette: one IntTag named after each entry."""
+    if not palette:
+        return 0
+    return sum(len(name.encode("utf-8")) + 7 for name in palette)
+
+
+def nbt_bytes(items: Optional[List]) -> int:
+    """Uncompressed NBT size of a list of (block) entity compounds."""
+    if not items:
+        return 0
+    return sum(len(item.to_nbt(compressed=False)) for item in items)
+
+
+def size_features(
+    block_indices,
+    block_palette: Sequence[str],
+    biome_indices=None,
+    biome_palette: Optional[Sequence[str]] = None,
+    block_entities: Optional[List] = None,
+    entities: Optional[List] = None,
+) -> List[float]:
+    """Return the model's features for one chunk, in FEATURES order."""
+    count, runs, entropy, varint_bytes = index_statistics(block_indices)
+    block_run_bits = runs * (entropy + np.log2(count / runs + 1)) if runs else 0.0
+
+    biome_runs = 0
+    if biome_indices is not None:
+        _, biome_runs, _, biome_varint_bytes = index_statistics(biome_indices)
+        varint_bytes += biome_varint_bytes
+
+    return [
+        1.0,
+        float(palette_bytes(block_palette) + palette_bytes(biome_palette)),
+        float(block_run_bits),
+        float(biome_runs),
+        float(varint_bytes),
+        float(nbt_bytes(block_entities) + nbt_bytes(entities)),
+    ]
+
+
+def predict_size(
+    base_size: int,
+    block_indices,
+    block_palette: Sequence[str],
+    biome_indices=None,
+    biome_palette: Optional[Sequence[str]] = None,
+    block_entities: Optional[List] = None,
+    entities: Optional[List] = None,
+    coefficients: Sequence[float] = COEFFICIENTS,
+) -> int:
+    """Estimate the gzipped size in bytes of a chunk schematic.
+
+    Args:
+        base_size: Compressed size of an empty one-block chunk built from
+                   the same source file.
+        coefficients: Model weights, in FEATURES order.
+    """
+    features = size_features(
+        block_indices,
+        block_palette,
+        biome_indices,
+        biome_palette,
+        block_entities,
+        entities,
+    )
+    return int(base_size + np.dot(coefficients, features))
@@ -0,0 +1,149 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class StageStats:
+    """Wall time, CPU time, byte and block counts for each pipeline stage.
+
+    Stages are recorded with the ``stage`` context manager. Entering a stage
+    name again (e.g. once per streamed band) adds to its totals. CPU time is
+    that of this process only, so work done in worker processes shows up as
+    wall time alone.
+
+    If ``profile_stage`` names a stage, every run of that stage is wrapped
+    in cProfile and the combined profile is available through
+    ``profile_report``.
+    """
+
+    def __init__(
+        self, profile_stage: Optional[str] = None, profile_output: Optional[str] = None
+    ):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.profile_stage = profile_stage
+        self.profile_output = profile_output
+        self._profile: Optional[pstats.Stats] = None
+
+    @contextmanager
+    def stage(
+        self, name: str, blocks: int = 0, bytes_in: int = 0, bytes_out: int = 0
+    ) -> Iterator[Dict[str, int]]:
+        """Time a stage. Counters in the yielded dict may be updated inside."""
+        counters = {"blocks": blocks, "bytes_in": bytes_in, "bytes_out": bytes_out}
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield counters
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._add_profile(profiler)
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+
+            record = self._record(name)
+            record["calls"] += 1
+            record["wall_seconds"] += wall
+            record["cpu_seconds"] += cpu
+            for key, value in counters.items():
+                record[key] += value
+
+    def add(
+        self,
+        name: str,
+        wall_seconds: float,
+        cpu_seconds: float = 0.0,
+        blocks: int = 0,
+        bytes_in: int = 0,
+        bytes_out: int = 0,
+    ) -> None:
+        """Record a run of a stage timed elsewhere, e.g. in a worker process."""
+        record = self._record(name)
+        record["calls"] += 1
+        record["wall_seconds"] += wall_seconds
+        record["cpu_seconds"] += cpu_seconds
+        record["blocks"] += blocks
+        record["bytes_in"] += bytes_in
+        record["bytes_out"] += bytes_out
+
+    def _record(self, name: str) -> Dict[str, float]:
+        return self.stages.setdefault(
+            name,
+            {
+                "calls": 0,
+                "wall_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "blocks": 0,
+                "bytes_in": 0,
+                "bytes_out": 0,
+            },
+        )
+
+    def _add_profile(self, profiler: cProfile.Profile) -> None:
+        if self._profile is None:
+            self._profile = pstats.Stats(profiler)
+        else:
+            self._profile.add(profiler)
+
+    def to_dict(self) -> Dict[str, object]:
+        """Return the recorded stages as JSON-serializable data."""
+        stages = {}
+        for name, record in self.stages.items():
+            wall = record["wall_seconds"]
+            stages[name] = {
+                **record,
+                "wall_seconds": round(wall, 6),
+                "cpu_seconds": round(record["cpu_seconds"], 6),
+                "blocks_per_second": (
+                    round(record["blocks"] / wall)
+                    if record["blocks"] and wall
+                    else None
+                ),
+            }
+        return {"stages": stages}
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write("\n")
+
+    def format_table(self) -> str:
+        """Return a human-readable summary of the recorded stages."""
+        lines = [
+            f"{'Stage':<28} {'Wall s':>9} {'CPU s':>9} {'Blocks/s':>12} "
+            f"{'In':>11} {'Out':>11}"
+        ]
+        for name, record in self.to_dict()["stages"].items():
+            rate = record["blocks_per_second"]
+            lines.append(
+                f"{name:<28} {record['wall_seconds']:>9.3f} "
+                f"{record['cpu_seconds']:>9.3f} "
+                f"{rate if rate is not None else '-':>12} "
+                f"{record['bytes_in']:>11} {record['bytes_out']:>11}"
+            )
+        return "\n".join(lines)
+
+    def profile_report(self, limit: int = 25) -> Optional[str]:
+        """Write or format the profile of ``profile_stage``, if one ran.
+
+        With ``profile_output`` set, the raw profile is dumped there for
+        tools such as snakeviz and the path is returned; otherwise the
+        ``limit`` most expensive functions are returned as text.
+        """
+        if self._profile is None:
+            return None
+        if self.profile_output:
+            self._profile.dump_stats(self.profile_output)
+            return f"Profile of '{self.profile_stage}' written to {self.profile_output}"
+        stream = io.StringIO()
+        self._profile.stream = stream
+        self._profile.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
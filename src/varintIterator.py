@@ -1,6 +1,8 @@
 # Adapted from World Edit's VarIntIterator implementation:
 # https://github.com/EngineHub/WorldEdit/blob/version/7.3.x/worldedit-core/src/main/java/com/sk89q/worldedit/internal/util/VarIntIterator.java
 
+import numpy as np
+
 
 class VarIntIterator:
     __slots__ = ("source", "index", "has_next_int", "next_int")
@@ -51,3 +53,105 @@ class VarIntIterator:
 
             if (next_byte & 0x80) == 0:
                 return value
+
+
+def _as_uint8(source) -> np.ndarray:
+    """View a bytes-like object or integer array as unsigned bytes."""
+    if isinstance(source, np.ndarray):
+        return source.view(np.uint8)
+    return np.frombuffer(source, dtype=np.uint8)
+
+
+# Bytes decoded at a time; bounds the temporary arrays of decode()
+DECODE_PIECE = 1 << 20
+
+
+def decode(source) -> np.ndarray:
+    """Decode an entire VarInt byte stream into a uint32 array in one pass.
+
+    Equivalent to ``np.array(list(VarIntIterator(source)))`` but vectorized
+    with NumPy. Streams where every value fits in one byte (palettes under
+    128 entries) are widened directly without locating VarInt boundaries.
+    Longer values are decoded DECODE_PIECE bytes at a time into the
+    preallocated output, so temporary memory does not grow with the stream.
+    """
+    data = _as_uint8(source)
+    if data.size == 0:
+        return np.empty(0, dtype=np.uint32)
+
+    if int(data.max()) < 0x80:
+        return data.astype(np.uint32)
+
+    count = 0
+    for start in range(0, data.size, DECODE_PIECE):
+        count += int(np.count_nonzero(data[start : start + DECODE_PIECE] < 0x80))
+
+    out = np.empty(count, dtype=np.uint32)
+    written = 0
+    start = 0
+    while start < data.size:
+        piece = data[start : start + DECODE_PIECE]
+        terminators = np.flatnonzero(piece < 0x80)
+        if terminators.size == 0:
+            if start + piece.size == data.size:
+                raise ValueError(
+                    "Ran out of bytes while reading VarInt (probably corrupted data)"
+                )
+            raise ValueError("VarInt too big (probably corrupted data)")
+        # End the piece on a value boundary; the rest starts the next one
+        stop = int(terminators[-1]) + 1
+        values = _decode_piece(piece[:stop], terminators.astype(np.int32))
+        out[written : written + values.size] = values
+        written += values.size
+        start += stop
+    return out
+
+
+def _decode_piece(data: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Decode bytes that end on a VarInt, given the offset of each last byte."""
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+
+    max_length = int(lengths.max())
+    if max_length > 5:
+        raise ValueError("VarInt too big (probably corrupted data)")
+
+    values = (data[starts] & 0x7F).astype(np.uint32)
+    for position in range(1, max_length):
+        longer = lengths > position
+        values[longer] |= (
+            data[starts[longer] + position].astype(np.uint32) & 0x7F
+        ) << (7 * position)
+    return values
+
+
+def decode_count(source, count: int, offset: int = 0):
+    """Decode exactly ``count`` VarInts starting at byte ``offset``.
+
+    Only the bytes holding those values are scanned, so a large stream can
+    be decoded piece by piece.
+
+    Returns:
+        (uint32 array of values, byte offset just past the last value)
+    """
+    data = _as_uint8(source)
+    found = 0
+    end = offset
+    while found < count and end < data.size:
+        # Every value needs at least one byte, so this never overshoots
+        step_end = min(data.size, end + (count - found))
+        found += int(np.count_nonzero(data[end:step_end] < 0x80))
+        end = step_end
+
+    if found < count:
+        raise ValueError(
+            "Ran out of bytes while reading VarInt (probably corrupted data)"
+        )
+    if count == 0:
+        return np.empty(0, dtype=np.uint32), offset
+
+    terminators = np.flatnonzero(data[offset:end] < 0x80)
+    stop = offset + int(terminators[count - 1]) + 1
+    return decode(data[offset:stop]), stop
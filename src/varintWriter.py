@@ -1,12 +1,55 @@
-def write(chunk,width,height,length) -> None:
-    buffer = bytearray()
-    for y in range(height):
-        for z in range(length):
-            for x in range(width):
-                id = chunk[int(x + z * width + y * width * length)]
-                while ((id & -128) != 0): 
-                    buffer.append(id & 127 | 128)
-                    id >>= 7
-                buffer.append(id)
-
-    return bytearray(buffer)
+import numpy as np
+
+
+def encode(indices) -> bytes:
+    """Encode a flat array of non-negative palette indices as VarInts.
+
+    Palettes under 128 entries are written one byte per index, and constant
+    arrays (e.g. all-air filler) repeat a single encoded value.
+    """
+    indices = np.asarray(indices)
+    count = indices.size
+    if count == 0:
+        return b""
+
+    if not any(indices.strides):
+        # Zero-stride (broadcast) arrays are constant by construction
+        lowest = highest = int(indices.flat[0])
+    else:
+        lowest = int(indices.min())
+        highest = int(indices.max())
+    if lowest < 0:
+        raise ValueError("VarInt palette indices must be non-negative")
+
+    if lowest == highest:
+        value = highest
+        encoded = bytearray()
+        while (value & -128) != 0:
+            encoded.append(value & 127 | 128)
+            value >>= 7
+        encoded.append(value)
+        return bytes(encoded) * count
+
+    if highest < 128:
+        return indices.astype(np.uint8).tobytes()
+
+    values = indices.astype(np.uint32)
+    lengths = np.ones(count, dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        lengths += values >= (1 << shift)
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    out = np.empty(int(ends[-1]), dtype=np.uint8)
+    for position in range(int(lengths.max())):
+        present = lengths > position
+        group = (values[present] >> (7 * position)) & 127
+        more = lengths[present] > position + 1
+        out[starts[present] + position] = group | (more.astype(np.uint32) << 7)
+    return out.tobytes()
+
+
+def write(chunk, width, height, length) -> bytearray:
+    """Encode a chunk's indices in x + z*width + y*width*length order."""
+    volume = width * height * length
+    return bytearray(encode(np.asarray(chunk).reshape(-1)[:volume]))
@@ -1,4 +1,7 @@
+import gzip
 import math
+import mmap
+import os
 import struct
 import time
 import zlib
@@ -13,36 +16,26 @@ def _bits_per_entry(palette_size):
 
 
 def _pack_states(indices, palette_size):
+    # 1.16+ layout: per_long entries from the low bits up, none spanning
+    # two longs, the top bits of each long left as padding
     bpe = _bits_per_entry(palette_size)
     per_long = 64 // bpe
-    mask = (1 << bpe) - 1
-    longs = []
-    idx = 0
-    for _ in range(math.ceil(4096 / per_long)):
-        val = 0
-        for slot in range(per_long):
-            if idx < len(indices):
-                val |= (indices[idx] & mask) << (slot * bpe)
-                idx += 1
-        if val >= (1 << 63):
-            val -= 1 << 64
-        longs.append(val)
-    return longs
+    count = math.ceil(4096 / per_long)
+    values = np.zeros(count * per_long, dtype=np.uint64)
+    indices = np.asarray(indices, dtype=np.uint64)[: values.size]
+    values[: indices.size] = indices & np.uint64((1 << bpe) - 1)
+    shifts = np.arange(per_long, dtype=np.uint64) * np.uint64(bpe)
+    packed = np.bitwise_or.reduce(values.reshape(count, per_long) << shifts, axis=1)
+    return packed.view(np.int64)
 
 
 def _unpack_states(long_array, palette_size):
     bpe = _bits_per_entry(palette_size)
     per_long = 64 // bpe
-    mask = (1 << bpe) - 1
-    indices = []
-    for v in long_array:
-        if v < 0:
-            v += 1 << 64
-        for slot in range(per_long):
-            if len(indices) >= 4096:
-                break
-            indices.append((v >> (slot * bpe)) & mask)
-    return indices[:4096]
+    longs = np.asarray(long_array, dtype=np.int64).view(np.uint64)
+    shifts = np.arange(per_long, dtype=np.uint64) * np.uint64(bpe)
+    values = (longs[:, None] >> shifts) & np.uint64((1 << bpe) - 1)
+    return values.reshape(-1)[:4096].astype(np.int64)
 
 
 def _read_region(path):
@@ -62,14 +55,32 @@ def _read_region(path):
         length = struct.unpack_from(">I", data, start)[0]
         comp = data[start + 4]
         raw = data[start + 5 : start + 4 + length]
-        if comp == 2:
-            try:
-                chunks[i] = zlib.decompress(raw)
-            except zlib.error:
-                pass
+        chunks[i] = _decompress_chunk(path, i, comp, raw)
     return chunks
 
 
+def _decompress_chunk(path, i, comp, raw):
+    # Chunks that cannot be read would be lost when the region is
+    # written back, so refuse rather than skip them
+    try:
+        if comp == 1:
+            return gzip.decompress(raw)
+        if comp == 2:
+            return zlib.decompress(raw)
+        if comp == 3:
+            return bytes(raw)
+    except (OSError, zlib.error) as e:
+        raise ValueError(f"{path}: chunk {i} is corrupt: {e}") from None
+    raise ValueError(f"{path}: chunk {i} uses unsupported compression type {comp}")
+
+
+def _compress_chunk(path, i, raw):
+    payload = zlib.compress(raw)
+    if math.ceil((5 + len(payload)) / SECTOR) > 255:
+        raise ValueError(f"{path}: chunk {i} is too large for a region file")
+    return payload
+
+
 def _write_region(path, chunks):
     compressed = {i: zlib.compress(raw) for i, raw in chunks.items()}
 
@@ -101,6 +112,103 @@ def _write_region(path, chunks):
         f.write(out)
 
 
+class RegionFile:
+    # Region file opened for in-place updates. The file is memory-mapped, so
+    # only the chunks that are read are touched. A rewritten chunk keeps its
+    # sectors if it still fits, otherwise it moves to the first free run of
+    # sectors, and the file grows only when there is none. Only the payload
+    # and header entries of written chunks change on disk.
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) < SECTOR * 2:
+            with open(path, "wb") as f:
+                f.write(bytes(SECTOR * 2))
+        self._file = open(path, "r+b")
+        size = os.path.getsize(path)
+        if size % SECTOR:
+            # Pad to whole sectors so the last chunk is not cut off
+            self._file.truncate(size + SECTOR - size % SECTOR)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._sector_count = len(self._map) // SECTOR
+        self._locations = {}
+        self._used = bytearray(self._sector_count)
+        self._used[0:2] = b"\x01\x01"
+        for i in range(1024):
+            entry = struct.unpack_from(">I", self._map, i * 4)[0]
+            offset, count = entry >> 8, entry & 0xFF
+            if offset < 2 or count == 0 or offset + count > self._sector_count:
+                continue
+            self._locations[i] = (offset, count)
+            self._used[offset : offset + count] = b"\x01" * count
+
+    def __contains__(self, i):
+        return i in self._locations
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, i):
+        offset, _ = self._locations[i]
+        start = offset * SECTOR
+        length = struct.unpack_from(">I", self._map, start)[0]
+        comp = self._map[start + 4]
+        return _decompress_chunk(
+            self.path, i, comp, self._map[start + 5 : start + 4 + length]
+        )
+
+    def write(self, i, raw):
+        self.write_compressed(i, _compress_chunk(self.path, i, raw))
+
+    def write_compressed(self, i, payload):
+        # payload as returned by _compress_chunk
+        needed = math.ceil((5 + len(payload)) / SECTOR)
+        offset, count = self._locations.get(i, (0, 0))
+        if count:
+            self._used[offset : offset + count] = bytes(count)
+        if needed > count:
+            offset = self._allocate(needed)
+        self._used[offset : offset + needed] = b"\x01" * needed
+
+        start = offset * SECTOR
+        block = bytearray(needed * SECTOR)
+        struct.pack_into(">IB", block, 0, 1 + len(payload), 2)
+        block[5 : 5 + len(payload)] = payload
+        self._map[start : start + len(block)] = block
+
+        self._locations[i] = (offset, needed)
+        struct.pack_into(">I", self._map, i * 4, (offset << 8) | needed)
+        struct.pack_into(">I", self._map, SECTOR + i * 4, int(time.time()))
+
+    def _allocate(self, needed):
+        run = 0
+        for sector in range(2, self._sector_count):
+            run = 0 if self._used[sector] else run + 1
+            if run == needed:
+                return sector - needed + 1
+        # Append, reusing any free sectors at the end of the file
+        offset = self._sector_count - run
+        self._grow(offset + needed)
+        return offset
+
+    def _grow(self, sector_count):
+        self._map.close()
+        self._file.truncate(sector_count * SECTOR)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used += bytes(sector_count - self._sector_count)
+        self._sector_count = sector_count
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+
 def _get_nbt(raw):
     return nbt.load(raw, compressed=False).compound
 
@@ -109,79 +217,179 @@ def _dump_nbt(compound):
     return nbt.NamedTag(compound).save_to(compressed=False)
 
 
-def _patch_chunk(chunk, sections_data):
-    if "sections" not in chunk:
-        chunk["sections"] = nbt.ListTag([])
-
-    sections_tag = chunk["sections"]
-    by_y = {}
-    for sec in sections_tag:
-        by_y[int(sec["Y"])] = sec
-
-    for sec_y, block_map in sections_data.items():
-        if sec_y in by_y:
-            _patch_section(by_y[sec_y], block_map)
-        else:
-            sections_tag.append(_new_section(sec_y, block_map))
-
-
-def _patch_section(section_tag, block_map):
-    bs = section_tag["block_states"]
-    palette_tag = bs["palette"]
+def _state_key(entry):
+    name = str(entry["Name"])
+    if "Properties" not in entry or not len(entry["Properties"]):
+        return name
+    props = sorted(f"{k}={v.py_str}" for k, v in entry["Properties"].items())
+    return f"{name}[{','.join(props)}]"
 
-    palette = [str(e["Name"]) for e in palette_tag]
-    palette_idx = {n: i for i, n in enumerate(palette)}
 
-    for name in block_map:
-        if name not in palette_idx:
-            palette_idx[name] = len(palette)
-            palette.append(name)
-            palette_tag.append(nbt.CompoundTag({"Name": nbt.StringTag(name)}))
-
-    if "data" in bs:
-        indices = _unpack_states(list(bs["data"].np_array), len(palette))
-        indices = (indices + [0] * 4096)[:4096]
-    else:
-        indices = [0] * 4096
-
-    for name, positions in block_map.items():
-        pid = palette_idx[name]
-        for lx, ly, lz in positions:
-            indices[(ly << 8) | (lz << 4) | lx] = pid
-
-    if len(palette) > 1:
-        bs["data"] = nbt.LongArrayTag(
-            np.array(_pack_states(indices, len(palette)), dtype=np.int64)
-        )
-
-
-def _new_section(sec_y, block_map):
-    palette = ["minecraft:air"]
-    palette_idx = {"minecraft:air": 0}
-    for name in block_map:
-        if name not in palette_idx:
-            palette_idx[name] = len(palette)
-            palette.append(name)
-
-    indices = [0] * 4096
-    for name, positions in block_map.items():
-        pid = palette_idx[name]
-        for lx, ly, lz in positions:
-            indices[(ly << 8) | (lz << 4) | lx] = pid
-
-    palette_tag = nbt.ListTag(
-        [nbt.CompoundTag({"Name": nbt.StringTag(name)}) for name in palette]
-    )
-
-    block_states = nbt.CompoundTag({"palette": palette_tag})
-    if len(palette) > 1:
-        block_states["data"] = nbt.LongArrayTag(
-            np.array(_pack_states(indices, len(palette)), dtype=np.int64)
+def _palette_entry(state):
+    # "minecraft:oak_log[axis=y]" -> {Name: ..., Properties: {axis: "y"}}
+    name, _, props = state.partition("[")
+    entry = nbt.CompoundTag({"Name": nbt.StringTag(name)})
+    pairs = [p.split("=", 1) for p in props.rstrip("]").split(",") if "=" in p]
+    if pairs:
+        entry["Properties"] = nbt.CompoundTag(
+            {k.strip(): nbt.StringTag(v.strip()) for k, v in pairs}
         )
-
+    return entry
+
+
+def _flat_positions(positions):
+    # Section offsets (ly << 8 | lz << 4 | lx), or (lx, ly, lz) rows
+    positions = np.asarray(positions, dtype=np.int64)
+    if positions.ndim == 2:
+        return (positions[:, 1] << 8) | (positions[:, 2] << 4) | positions[:, 0]
+    return positions
+
+
+class SectionCache:
+    # Decoded sections of one chunk. Each section is unpacked on first use
+    # into a 4096-entry index array and palette, edits are scattered into
+    # it, and flush() packs each dirty section once
+
+    def __init__(self, chunk):
+        if "sections" not in chunk:
+            chunk["sections"] = nbt.ListTag([])
+        self.sections_tag = chunk["sections"]
+        self.tags = {int(sec["Y"]): sec for sec in self.sections_tag}
+        # {section_y: (indices, palette keys, palette tags, {key: index})}
+        self.decoded = {}
+        self.dirty = set()
+
+    def _decode(self, sec_y):
+        if sec_y in self.decoded:
+            return self.decoded[sec_y]
+        indices = np.zeros(4096, dtype=np.int64)
+        tag = self.tags.get(sec_y)
+        if tag is None or "block_states" not in tag:
+            palette_tags = [_palette_entry("minecraft:air")]
+        else:
+            bs = tag["block_states"]
+            palette_tags = list(bs["palette"])
+            if "data" in bs:
+                unpacked = _unpack_states(bs["data"].np_array, len(palette_tags))
+                indices[: unpacked.size] = unpacked
+        palette = [_state_key(e) for e in palette_tags]
+        palette_idx = {}
+        for i, name in enumerate(palette):
+            palette_idx.setdefault(name, i)
+        self.decoded[sec_y] = (indices, palette, palette_tags, palette_idx)
+        return self.decoded[sec_y]
+
+    def apply(self, sec_y, block_map):
+        # block_map: {block_state: positions}
+        indices, palette, palette_tags, palette_idx = self._decode(sec_y)
+        for name, positions in block_map.items():
+            pid = palette_idx.get(name)
+            if pid is None:
+                pid = palette_idx[name] = len(palette)
+                palette.append(name)
+                palette_tags.append(_palette_entry(name))
+            indices[_flat_positions(positions)] = pid
+        self.dirty.add(sec_y)
+
+    def flush(self):
+        for sec_y in sorted(self.dirty):
+            indices, palette, palette_tags, palette_idx = self.decoded.pop(sec_y)
+            # Drop entries nothing refers to any more, so palettes do not
+            # grow each time the same area is patched
+            used = np.flatnonzero(np.bincount(indices, minlength=len(palette)))
+            remap = np.zeros(len(palette), dtype=np.int64)
+            remap[used] = np.arange(used.size)
+            indices = remap[indices]
+
+            block_states = nbt.CompoundTag(
+                {"palette": nbt.ListTag([palette_tags[i] for i in used.tolist()])}
+            )
+            if used.size > 1:
+                block_states["data"] = nbt.LongArrayTag(
+                    _pack_states(indices, used.size)
+                )
+
+            tag = self.tags.get(sec_y)
+            if tag is None:
+                tag = self.tags[sec_y] = nbt.CompoundTag({"Y": nbt.ByteTag(sec_y)})
+                self.sections_tag.append(tag)
+            tag["block_states"] = block_states
+        self.dirty.clear()
+
+
+def _new_chunk(cx, cz, data_version):
+    # Lighting and heightmaps are left for the game to recompute
     return nbt.CompoundTag(
         {
-            "Y": nbt.ByteTag(sec_y),
-            "block_states": block_states,
+            "DataVersion": nbt.IntTag(data_version),
+            "xPos": nbt.IntTag(cx),
+            "zPos": nbt.IntTag(cz),
+            "yPos": nbt.IntTag(-4),
+            "Status": nbt.StringTag("minecraft:full"),
+            "isLightOn": nbt.ByteTag(0),
+            "sections": nbt.ListTag([]),
+            "block_entities": nbt.ListTag([]),
         }
     )
+
+
+def _drop_replaced_block_entities(chunk, sections_data):
+    if "block_entities" not in chunk or not len(chunk["block_entities"]):
+        return
+    written = {}
+    kept = []
+    for be in chunk["block_entities"]:
+        x, y, z = int(be["x"]), int(be["y"]), int(be["z"])
+        sec_y = y >> 4
+        if sec_y in sections_data:
+            if sec_y not in written:
+                mask = np.zeros(4096, dtype=bool)
+                for positions in sections_data[sec_y].values():
+                    mask[_flat_positions(positions)] = True
+                written[sec_y] = mask
+            if written[sec_y][((y & 15) << 8) | ((z & 15) << 4) | (x & 15)]:
+                continue
+        kept.append(be)
+    chunk["block_entities"] = nbt.ListTag(kept)
+
+
+def region_path(region_dir, rx, rz):
+    return os.path.join(region_dir, f"r.{rx}.{rz}.mca")
+
+
+def patch_region(path, chunk_edits, data_version, chunk_block_entities=None):
+    # chunk_edits: {(cx, cz): {section_y: {block_state: positions}}}, with
+    # positions as section offsets or (lx, ly, lz) rows
+    # chunk_block_entities: {(cx, cz): [block entity compound, ...]}
+    created = 0
+    with RegionFile(path) as region:
+        # Every chunk is read, patched and compressed before the first write,
+        # so a chunk that cannot be loaded leaves the region untouched
+        payloads = {}
+        for (cx, cz), sections_data in chunk_edits.items():
+            i = (cx & 31) + (cz & 31) * 32
+            if i in region:
+                chunk = _get_nbt(region.read(i))
+            else:
+                chunk = _new_chunk(cx, cz, data_version)
+                created += 1
+            sections = SectionCache(chunk)
+            for sec_y, block_map in sections_data.items():
+                sections.apply(sec_y, block_map)
+            sections.flush()
+            # Stored light and heightmaps describe the old blocks; with them
+            # gone the game relights the chunk and rebuilds its heightmaps
+            chunk["isLightOn"] = nbt.ByteTag(0)
+            if "Heightmaps" in chunk:
+                del chunk["Heightmaps"]
+            _drop_replaced_block_entities(chunk, sections_data)
+            new_bes = (chunk_block_entities or {}).get((cx, cz))
+            if new_bes:
+                if "block_entities" not in chunk:
+                    chunk["block_entities"] = nbt.ListTag([])
+                for be in new_bes:
+                    chunk["block_entities"].append(be)
+            payloads[i] = _compress_chunk(path, i, _dump_nbt(chunk))
+        for i, payload in payloads.items():
+            region.write_compressed(i, payload)
+    return len(chunk_edits), created
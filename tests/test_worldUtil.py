@@ -0,0 +1,238 @@
+"""Checks for the region file and block state packing code in worldUtil.
+
+python -m pytest tests
+"""
+
+import math
+import os
+import random
+import struct
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+import worldUtil  # noqa: E402
+from worldUtil import SECTOR, RegionFile  # noqa: E402
+
+# ---------------------------------------------------------------------------
+# Block state packing
+# ---------------------------------------------------------------------------
+
+
+def _reference_pack(indices, palette_size):
+    """The original one-entry-at-a-time packer."""
+    bpe = worldUtil._bits_per_entry(palette_size)
+    per_long = 64 // bpe
+    mask = (1 << bpe) - 1
+    longs = []
+    idx = 0
+    for _ in range(math.ceil(4096 / per_long)):
+        val = 0
+        for slot in range(per_long):
+            if idx < len(indices):
+                val |= (indices[idx] & mask) << (slot * bpe)
+                idx += 1
+        if val >= (1 << 63):
+            val -= 1 << 64
+        longs.append(val)
+    return longs
+
+
+def _reference_unpack(long_array, palette_size):
+    """The original one-entry-at-a-time unpacker."""
+    bpe = worldUtil._bits_per_entry(palette_size)
+    per_long = 64 // bpe
+    mask = (1 << bpe) - 1
+    indices = []
+    for v in long_array:
+        if v < 0:
+            v += 1 << 64
+        for slot in range(per_long):
+            if len(indices) >= 4096:
+                break
+            indices.append((v >> (slot * bpe)) & mask)
+    return indices[:4096]
+
+
+PALETTE_SIZES = [1, 2, 16, 17, 32, 33, 100, 255, 256, 257, 1000, 4096]
+
+
+def test_pack_states_matches_reference():
+    rng = np.random.default_rng(0)
+    for palette_size in PALETTE_SIZES:
+        for _ in range(5):
+            indices = rng.integers(0, palette_size, size=4096).tolist()
+            packed = worldUtil._pack_states(indices, palette_size)
+            assert packed.tolist() == _reference_pack(indices, palette_size)
+
+
+def test_pack_states_sets_sign_bit():
+    # Entries reaching bit 63 must come out as negative longs
+    packed = worldUtil._pack_states([(1 << 16) - 1] * 4096, 1 << 16)
+    assert packed.tolist() == _reference_pack([(1 << 16) - 1] * 4096, 1 << 16)
+    assert int(packed[0]) < 0
+
+
+def test_unpack_states_matches_reference():
+    rng = np.random.default_rng(1)
+    for palette_size in PALETTE_SIZES:
+        bpe = worldUtil._bits_per_entry(palette_size)
+        count = math.ceil(4096 / (64 // bpe))
+        # Any bit pattern, padding bits included, must decode alike
+        longs = rng.integers(-(1 << 63), (1 << 63) - 1, size=count).tolist()
+        unpacked = worldUtil._unpack_states(longs, palette_size)
+        assert unpacked.tolist() == _reference_unpack(longs, palette_size)
+
+
+def test_pack_unpack_round_trip():
+    rng = np.random.default_rng(2)
+    for palette_size in PALETTE_SIZES:
+        indices = rng.integers(0, palette_size, size=4096)
+        packed = worldUtil._pack_states(indices, palette_size)
+        unpacked = worldUtil._unpack_states(packed, palette_size)
+        assert np.array_equal(unpacked, indices)
+
+
+# ---------------------------------------------------------------------------
+# Region files
+# ---------------------------------------------------------------------------
+
+
+def _header(path):
+    """Return {chunk index: (sector offset, sector count)} and the sector count."""
+    with open(path, "rb") as f:
+        data = f.read()
+    locations = {}
+    for i in range(1024):
+        entry = struct.unpack_from(">I", data, i * 4)[0]
+        if entry:
+            locations[i] = (entry >> 8, entry & 0xFF)
+    return locations, len(data) // SECTOR
+
+
+def _check_layout(locations, sector_count):
+    """Assert no two chunks share a sector and all lie past the header."""
+    used = bytearray(sector_count)
+    for i, (offset, count) in locations.items():
+        assert offset >= 2, f"chunk {i} overlaps the header"
+        assert count > 0, f"chunk {i} has no sectors"
+        assert offset + count <= sector_count, f"chunk {i} runs past the file"
+        assert not any(used[offset : offset + count]), f"chunk {i} overlaps another"
+        used[offset : offset + count] = b"\x01" * count
+    return used
+
+
+def _longest_free_run(used):
+    longest = run = 0
+    for sector in range(2, len(used)):
+        run = 0 if used[sector] else run + 1
+        longest = max(longest, run)
+    return longest
+
+
+def _payload(rng, size):
+    # Half noise so sizes survive zlib, half repeats so some chunks shrink
+    noise = rng.randbytes(size // 2)
+    return noise + bytes([size % 256]) * (size - len(noise))
+
+
+def test_region_file_random_writes(tmp_path):
+    rng = random.Random(0)
+    path = str(tmp_path / "r.0.0.mca")
+    expected = {}
+    region = RegionFile(path)
+    try:
+        for step in range(3000):
+            i = rng.randrange(1024) if rng.random() < 0.5 else rng.randrange(32)
+            if rng.random() < 0.8:
+                size = rng.randrange(1, 3 * SECTOR)
+            else:
+                size = rng.randrange(3 * SECTOR, 64 * SECTOR)
+            raw = _payload(rng, size)
+
+            region._map.flush()
+            before, sectors_before = _header(path)
+            free_before = bytearray(_check_layout(before, sectors_before))
+            if i in before:
+                offset, count = before[i]
+                free_before[offset : offset + count] = bytes(count)
+
+            region.write(i, raw)
+            expected[i] = raw
+            assert region.read(i) == raw
+
+            region._map.flush()
+            after, sectors_after = _header(path)
+            _check_layout(after, sectors_after)
+            assert set(after) == set(expected)
+            needed = after[i][1]
+            if sectors_after > sectors_before:
+                # The file only grows when no free run could hold the chunk
+                assert _longest_free_run(free_before) < needed
+                assert after[i][0] + needed == sectors_after
+
+            if step % 500 == 499:
+                region.close()
+                region = RegionFile(path)
+    finally:
+        region.close()
+
+    with RegionFile(path) as region:
+        for i, raw in expected.items():
+            assert region.read(i) == raw
+    assert worldUtil._read_region(path) == expected
+
+
+def test_region_file_keeps_untouched_chunks(tmp_path):
+    path = str(tmp_path / "r.0.0.mca")
+    chunks = {i: bytes([i % 256]) * (i * 37 + 1) for i in range(0, 1024, 7)}
+    worldUtil._write_region(path, chunks)
+    with open(path, "rb") as f:
+        original = f.read()
+
+    with RegionFile(path) as region:
+        region.write(14, b"replaced")
+    with open(path, "rb") as f:
+        patched = f.read()
+
+    locations, _ = _header(path)
+    offset, count = locations[14]
+    changed = {
+        sector
+        for sector in range(len(original) // SECTOR)
+        if original[sector * SECTOR : (sector + 1) * SECTOR]
+        != patched[sector * SECTOR : (sector + 1) * SECTOR]
+    }
+    # Only the header sectors and the chunk's own sectors are written
+    assert changed <= {0, 1} | set(range(offset, offset + count))
+    assert worldUtil._read_region(path) == {**chunks, 14: b"replaced"}
+
+
+def test_patch_region_leaves_file_unchanged_on_unreadable_chunk(tmp_path):
+    path = str(tmp_path / "r.0.0.mca")
+    chunks = {
+        i: worldUtil._dump_nbt(worldUtil._new_chunk(i % 32, i // 32, 3700))
+        for i in (0, 1, 2)
+    }
+    worldUtil._write_region(path, chunks)
+    # Mark chunk 2 as LZ4-compressed, which cannot be read
+    locations, _ = _header(path)
+    with open(path, "r+b") as f:
+        f.seek(locations[2][0] * SECTOR + 4)
+        f.write(bytes([4]))
+    with open(path, "rb") as f:
+        original = f.read()
+
+    stone = {0: {"minecraft:stone": [(0, 0, 0)]}}
+    edits = {(0, 0): stone, (1, 0): stone, (2, 0): stone}
+    with pytest.raises(ValueError, match="compression type 4"):
+        worldUtil.patch_region(path, edits, 3700)
+    with open(path, "rb") as f:
+        assert f.read() == original
+
+    # Without the unreadable chunk the same edits go through
+    del edits[(2, 0)]
+    assert worldUtil.patch_region(path, edits, 3700) == (2, 0)